@@ -3,7 +3,13 @@ from flask import Flask
 from flask_cors import CORS
 from config import Config
 from models import db
-from routes import auth, health, routes, chats
+from utils import feed, profiling, responses
+from utils.message_search import init_message_search
+from utils.realtime import init_realtime
+from utils.jobs import init_jobs
+from utils.presence import init_presence
+from utils.commute_matching import init_commute_matching
+from routes import auth, health, routes, chats, stops, commutes, batch, realtime, admin, presence
 
 # Create Flask app
 app = Flask(__name__)
@@ -33,15 +39,45 @@ CORS(app,
 # Initialize database
 db.init_app(app)
 
+# Serve transit data from the currently published feed version
+with app.app_context():
+    transit_engine = db.engines['transit']
+feed.init_app(app, transit_engine, os.path.dirname(transit_engine.url.database))
+
+# In-memory presence and typing indicators
+init_presence(app)
+
+# Compress large JSON responses
+responses.init_app(app)
+
 # Create database tables
 with app.app_context():
     db.create_all()
+    init_message_search(db.engine)
 
 # Register routes
 auth.register_routes(app)
 health.register_routes(app)
 routes.register_routes(app)
 chats.register_routes(app)
+stops.register_routes(app)
+commutes.register_routes(app)
+batch.register_routes(app)
+realtime.register_routes(app)
+admin.register_routes(app)
+presence.register_routes(app)
+
+# Build the commute index in the background
+init_commute_matching(app)
+
+# Poll the GTFS-realtime feed, if configured
+init_realtime(app)
+
+# Background jobs (in-process if JOBS_IN_PROCESS, otherwise run_jobs.py)
+init_jobs(app)
+
+# Opt-in profiling middleware
+profiling.init_app(app)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
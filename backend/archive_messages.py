@@ -0,0 +1,48 @@
+"""
+Script to move old chat messages into the compressed archive (cold tier).
+Run it periodically, e.g. nightly from cron:
+
+    python archive_messages.py [days]
+
+Messages older than `days` (default MESSAGE_ARCHIVE_AFTER_DAYS) are packed
+into per-chat blocks, see utils/message_archive.py. Each chat is archived
+in its own transaction, so the job can be stopped and rerun at any time.
+"""
+
+import os
+import sys
+import time
+from datetime import timedelta
+from sqlalchemy import func
+
+# Scripts don't serve requests, so they have no caches to refresh (see PROCESS_REFRESH)
+os.environ.setdefault('PROCESS_REFRESH', '0')
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.chat import Message, MessageArchive  # noqa: E402
+from utils.message_archive import archive_messages  # noqa: E402
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else app.config['MESSAGE_ARCHIVE_AFTER_DAYS']
+
+    with app.app_context():
+        start = time.time()
+        chats, messages = archive_messages(
+            db.session, timedelta(days=days), app.config['MESSAGE_ARCHIVE_BLOCK_SIZE']
+        )
+        print(f"Archived {messages} messages older than {days} days from {chats} chats "
+              f"in {time.time() - start:.1f}s")
+
+        blocks, archived, archived_bytes = db.session.query(
+            func.count(MessageArchive.id),
+            func.coalesce(func.sum(MessageArchive.message_count), 0),
+            func.coalesce(func.sum(func.length(MessageArchive.data)), 0)
+        ).one()
+        print(f"  Hot messages: {db.session.query(func.count(Message.id)).scalar()}")
+        print(f"  Archived messages: {archived} in {blocks} blocks ({archived_bytes / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+ASGI entry point. The chat endpoints (list, history, send) run natively async
+on Starlette with SQLAlchemy's asyncio extension (aiosqlite, or asyncpg for
+PostgreSQL); every other path is passed through to the Flask app unchanged.
+
+    pip install -r requirements-asgi.txt
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+A chat request waiting on the database only parks a coroutine, so one
+process can hold thousands of concurrent chat clients where a sync worker
+is tied up per request. Models, serializers and the archive reader are
+shared with the Flask routes.
+
+Sends commit directly rather than through the write-behind writer
+(CHAT_WRITE_BEHIND), which exists to stop sync workers from blocking on
+commits; here awaiting a commit doesn't hold a worker.
+"""
+
+import contextlib
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app, allowed_origins
+from models import db
+from models.user import User
+from models.chat import Chat, ChatParticipant, Message, MessageArchive
+from utils import presence
+from utils.auth import decode_token
+from utils.message_archive import MESSAGE_COLUMNS, message_to_dict, page_chat_messages, read_block
+from utils.responses import STREAM_CHUNK_SIZE
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+with flask_app.app_context():
+    chat_url = db.engine.url  # relative SQLite paths already resolved by Flask-SQLAlchemy
+
+engine = create_async_engine(chat_url.set(drivername=ASYNC_DRIVERS[chat_url.get_backend_name()]))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+def json_response(data, status=200):
+    """JSON response rendered like Flask's jsonify()"""
+    return Response(flask_app.json.dumps(data), status_code=status, media_type='application/json')
+
+
+def token_required(endpoint):
+    """Async counterpart of utils.auth.token_required"""
+    async def decorated(request):
+        token = None
+
+        # Get token from Authorization header
+        if 'Authorization' in request.headers:
+            try:
+                token = request.headers['Authorization'].split(' ')[1]  # Expected format: "Bearer <token>"
+            except IndexError:
+                return json_response({'error': 'Invalid token format'}, 401)
+
+        if not token:
+            return json_response({'error': 'Token is missing'}, 401)
+
+        payload = decode_token(token, flask_app.config['SECRET_KEY'])
+        if not payload:
+            return json_response({'error': 'Token is invalid or expired'}, 401)
+
+        presence.seen(payload['user_id'])
+        return await endpoint(request, user_id=payload['user_id'])
+
+    return decorated
+
+
+async def is_participant(session, chat_id, user_id):
+    return await session.scalar(select(ChatParticipant.id).where(
+        ChatParticipant.chat_id == chat_id, ChatParticipant.user_id == user_id
+    )) is not None
+
+
+def chats_for_user(session, user_id):
+    """Serialized chats of a user, newest first (run via AsyncSession.run_sync)"""
+    chat_ids = session.scalars(select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id)).all()
+    if not chat_ids:
+        return []
+    chats = session.scalars(select(Chat).where(Chat.id.in_(chat_ids)).order_by(Chat.updated_at.desc())).all()
+    chats = [chat.to_dict(current_user_id=user_id) for chat in chats]
+    presence.mark_online([participant for chat in chats for participant in chat['participants']])
+    return chats
+
+
+@token_required
+async def get_user_chats(request, user_id):
+    """Get all chats for the current user"""
+    try:
+        async with Session() as session:
+            chats = await session.run_sync(chats_for_user, user_id)
+        return json_response({'chats': chats})
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+async def stream_chat_messages(chat_id):
+    """Every message in a chat as a {"messages": [...]} document, archived ones first"""
+    dumps = flask_app.json.dumps
+    async with Session() as session:
+        # Only participants can send, so their names cover every message
+        usernames = dict((await session.execute(
+            select(ChatParticipant.user_id, User.username)
+            .join(User, User.id == ChatParticipant.user_id)
+            .where(ChatParticipant.chat_id == chat_id)
+        )).all())
+
+        async def rows():
+            blocks = await session.stream(
+                select(MessageArchive.codec, MessageArchive.data).where(MessageArchive.chat_id == chat_id)
+                .order_by(MessageArchive.first_created_at, MessageArchive.first_message_id)
+            )
+            async for codec, data in blocks:
+                for row in read_block(codec, data):
+                    yield row
+            hot = await session.stream(
+                select(*MESSAGE_COLUMNS).where(Message.chat_id == chat_id)
+                .order_by(Message.created_at, Message.id)
+            )
+            async for row in hot:
+                yield tuple(row)
+
+        buffer = [b'{"messages":[']
+        size = 0
+        first = True
+        async for row in rows():
+            data = dumps(message_to_dict(chat_id, row, usernames)).encode()
+            buffer.append(data if first else b',' + data)
+            first = False
+            size += len(data) + 1
+            if size >= STREAM_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        buffer.append(b']}')
+        yield b''.join(buffer)
+
+
+@token_required
+async def get_chat_messages(request, user_id):
+    """Get messages in a chat: all of them, or a page with ?limit= and ?before=<cursor>"""
+    chat_id = request.path_params['chat_id']
+    try:
+        async with Session() as session:
+            if not await is_participant(session, chat_id, user_id):
+                return json_response({'error': 'Chat not found or access denied'}, 404)
+
+            if 'limit' in request.query_params or 'before' in request.query_params:
+                try:
+                    limit = int(request.query_params.get('limit', 50))
+                except ValueError:
+                    limit = 50
+                limit = min(max(limit, 1), 200)
+                try:
+                    messages, next_before = await session.run_sync(
+                        page_chat_messages, chat_id, before=request.query_params.get('before'), limit=limit
+                    )
+                except ValueError as e:
+                    return json_response({'error': str(e)}, 400)
+
+                return json_response({
+                    'messages': messages,
+                    'next_before': next_before
+                })
+
+        return StreamingResponse(stream_chat_messages(chat_id), media_type='application/json')
+
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@token_required
+async def send_message(request, user_id):
+    """Send a message in a chat"""
+    chat_id = request.path_params['chat_id']
+    try:
+        async with Session() as session:
+            if not await is_participant(session, chat_id, user_id):
+                return json_response({'error': 'Chat not found or access denied'}, 404)
+
+            data = await request.json()
+            content = data.get('content', '').strip()
+
+            if not content:
+                return json_response({'error': 'Message content is required'}, 400)
+
+            sender_username = await session.scalar(select(User.username).where(User.id == user_id))
+
+            message = Message(chat_id=chat_id, sender_id=user_id, content=content)
+            session.add(message)
+            await session.execute(update(Chat).where(Chat.id == chat_id).values(updated_at=func.now()))
+            await session.commit()
+
+            return json_response({
+                'message': message_to_dict(
+                    chat_id, (message.id, user_id, message.created_at, content), {user_id: sender_username}
+                )
+            }, 201)
+
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    yield
+    await engine.dispose()
+
+
+application = Starlette(
+    routes=[
+        Route('/api/chats', get_user_chats, methods=['GET']),
+        Route('/api/chats/{chat_id:int}/messages', get_chat_messages, methods=['GET']),
+        Route('/api/chats/{chat_id:int}/messages', send_message, methods=['POST']),
+        # Everything else (including other methods on the paths above) is served by Flask
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[
+        # Same policy as flask_cors in app.py; preflights are answered here
+        Middleware(CORSMiddleware,
+                   allow_origins=allowed_origins,
+                   allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+                   allow_headers=['Content-Type', 'Authorization'],
+                   expose_headers=['Content-Type', 'Authorization'],
+                   max_age=3600),
+        # Leaves responses Flask already compressed alone
+        Middleware(GZipMiddleware, minimum_size=flask_app.config['COMPRESS_MIN_SIZE']),
+    ],
+    lifespan=lifespan,
+)
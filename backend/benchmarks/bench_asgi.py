@@ -0,0 +1,208 @@
+"""
+Load test: chat endpoints on gunicorn sync workers (app:app) vs the ASGI
+mode on uvicorn (asgi:application), at 10, 100 and 1000 concurrent clients.
+
+Each client repeatedly loads its chat list, the latest page of its chat and
+sends a message. Both servers run against the same freshly populated
+throwaway database. Needs requirements-asgi.txt; run from the backend
+directory:
+
+    python benchmarks/bench_asgi.py [gunicorn_workers]
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+os.environ['TRANSIT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'transit.db')}"
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.user import User  # noqa: E402
+from models.chat import Chat, ChatParticipant, Message  # noqa: E402
+from utils.auth import generate_token  # noqa: E402
+
+GUNICORN_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+CLIENT_COUNTS = [10, 100, 1000]
+ROUNDS_PER_CLIENT = 2  # each round is 3 requests
+MESSAGES_PER_CHAT = 200
+PORT = 5099
+
+SERVERS = {
+    f'gunicorn sync x{GUNICORN_WORKERS}': ['gunicorn', '-w', str(GUNICORN_WORKERS), '-k', 'sync',
+                                           '--backlog', '4096', '-b', f'127.0.0.1:{PORT}', 'app:app'],
+    'uvicorn asgi x1': ['uvicorn', 'asgi:application', '--port', str(PORT),
+                        '--backlog', '4096', '--log-level', 'warning'],
+}
+
+
+def populate():
+    """One chat per client, each with a shared second participant and some history"""
+    clients = max(CLIENT_COUNTS)
+    with app.app_context():
+        db.session.query(Message).delete()
+        db.session.query(ChatParticipant).delete()
+        db.session.query(Chat).delete()
+        db.session.query(User).delete()
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x'}
+            for i in range(clients + 1)
+        ])
+        db.session.execute(Chat.__table__.insert(), [{'id': i} for i in range(1, clients + 1)])
+        db.session.execute(ChatParticipant.__table__.insert(), [
+            {'chat_id': i, 'user_id': user_id} for i in range(1, clients + 1) for user_id in (i, 0)
+        ])
+        db.session.execute(Message.__table__.insert(), [
+            {'chat_id': i, 'sender_id': i if n % 2 else 0, 'content': f'message {n}'}
+            for i in range(1, clients + 1) for n in range(MESSAGES_PER_CHAT)
+        ])
+        db.session.commit()
+
+
+async def http(connection, method, path, token, body=None):
+    """Minimal HTTP/1.1 client; reconnects when the server closes the connection"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    if connection.get('writer') is None:
+        connection['reader'], connection['writer'] = await asyncio.open_connection('127.0.0.1', PORT)
+    reader, writer = connection['reader'], connection['writer']
+
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, value = line.decode().split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+
+    if headers.get('connection', '').lower() == 'close' or 'content-length' not in headers \
+            and headers.get('transfer-encoding') != 'chunked':
+        writer.close()
+        connection['writer'] = None
+    return status
+
+
+async def client(user_id, latencies, errors):
+    token = generate_token(user_id, app.config['SECRET_KEY'])
+    connection = {}
+    requests = [
+        ('GET', '/api/chats', None),
+        ('GET', f'/api/chats/{user_id}/messages?limit=50', None),
+        ('POST', f'/api/chats/{user_id}/messages', {'content': 'hello'}),
+    ]
+    for _ in range(ROUNDS_PER_CLIENT):
+        for method, path, body in requests:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(http(connection, method, path, token, body), 120)
+                if status >= 300:
+                    errors.append(status)
+            except Exception as e:
+                errors.append(type(e).__name__)
+                connection['writer'] = None
+            latencies.append(time.perf_counter() - start)
+    if connection.get('writer') is not None:
+        connection['writer'].close()
+
+
+async def load(clients):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(user_id, latencies, errors) for user_id in range(1, clients + 1)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': len(errors),
+    }
+
+
+def resident_mb(pid):
+    """RSS of a process and its direct children (gunicorn workers), from /proc"""
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except OSError:
+                continue
+    total_kb = 0
+    for child in pids:
+        with open(f'/proc/{child}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+def wait_for_port():
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def main():
+    print(f"Populating {max(CLIENT_COUNTS)} chats...")
+    populate()
+
+    results = {}
+    for name, command in SERVERS.items():
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=os.environ.copy(),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port()
+            asyncio.run(load(10))  # warm up (imports, connection pools, page cache)
+            for clients in CLIENT_COUNTS:
+                results[name, clients] = asyncio.run(load(clients))
+                results[name, clients]['rss'] = resident_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"\nChat load test ({ROUNDS_PER_CLIENT * 3} requests per client: list, history page, send)")
+    print(f"  {'server':<20} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7} {'RSS MB':>7}")
+    for (name, clients), result in results.items():
+        print(f"  {name:<20} {clients:>7} {result['rps']:>8.0f} {result['p50']:>8.1f} "
+              f"{result['p99']:>9.1f} {result['errors']:>7} {result['rss']:>7.0f}")
+
+
+if __name__ == '__main__':
+    main()
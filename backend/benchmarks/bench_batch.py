@@ -0,0 +1,99 @@
+"""
+Benchmark: a cold dashboard load as separate API calls vs one /api/batch call.
+
+Uses a throwaway chat database and the published transit feed, so run from
+the backend directory after `python import_gtfs.py`:
+
+    python benchmarks/bench_batch.py
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.user import User  # noqa: E402
+from models.transit import Route  # noqa: E402
+from models.user_route import UserRoute  # noqa: E402
+from models.chat import Chat, ChatParticipant, Message  # noqa: E402
+from utils.auth import generate_token  # noqa: E402
+
+USERS = 200
+REPEATS = 50
+RTT_MS = (20, 50, 100)
+
+
+def populate():
+    with app.app_context():
+        route_ids = [route.route_id for route in Route.query.order_by(Route.route_id).all()]
+        db.session.add_all([User(id=i, username=f'user{i}', email=f'user{i}@example.com', password='x')
+                            for i in range(1, USERS + 1)])
+        db.session.add_all([UserRoute(user_id=i, route_id=route_ids[(i + k) % len(route_ids)])
+                            for i in range(1, USERS + 1) for k in range(3)])
+        for other in range(2, 7):
+            chat = Chat()
+            db.session.add(chat)
+            db.session.flush()
+            db.session.add_all([ChatParticipant(chat_id=chat.id, user_id=1),
+                                ChatParticipant(chat_id=chat.id, user_id=other)])
+            db.session.add_all([Message(chat_id=chat.id, sender_id=1 + n % 2 * (other - 1),
+                                        content=f'message {n}') for n in range(50)])
+        db.session.commit()
+        return db.session.query(ChatParticipant.chat_id).filter_by(user_id=1).first()[0]
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    chat_id = populate()
+    paths = ['/api/routes', '/api/user/routes', '/api/chats', '/api/connect/users',
+             f'/api/chats/{chat_id}', f'/api/chats/{chat_id}/messages']
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {generate_token(1, app.config["SECRET_KEY"])}'}
+
+    def separate():
+        for path in paths:
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code)
+
+    def batched():
+        response = client.post('/api/batch', headers=headers,
+                               json={'requests': [{'method': 'GET', 'path': path} for path in paths]})
+        assert all(result['status'] == 200 for result in response.get_json()['responses'])
+
+    separate_ms = timed(separate)
+    batch_ms = timed(batched)
+
+    # Cross-origin requests with an Authorization header are preflighted, and
+    # preflights are cached per URL, so a cold load pays one per distinct URL
+    separate_trips = len(paths) * 2
+    batch_trips = 2
+
+    print(f"Cold dashboard load: {len(paths)} API calls vs 1 batch (median of {REPEATS})")
+    print(f"  server time       separate {separate_ms:7.2f} ms   batch {batch_ms:7.2f} ms")
+    print(f"  HTTP exchanges    separate {separate_trips:7d}      batch {batch_trips:7d}   "
+          f"(requests + CORS preflights)")
+    for rtt in RTT_MS:
+        # Upper bound for separate calls: each request waits for the previous one
+        print(f"  at {rtt:3d} ms RTT      separate {separate_trips * rtt + separate_ms:7.0f} ms   "
+              f"batch {batch_trips * rtt + batch_ms:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
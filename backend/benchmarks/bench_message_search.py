@@ -0,0 +1,111 @@
+"""
+Benchmark: FTS5 message search vs a LIKE '%term%' scan on synthetic messages.
+
+Uses a throwaway database, run from the backend directory:
+
+    python benchmarks/bench_message_search.py [message_count]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+os.environ['TRANSIT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'transit.db')}"
+
+from sqlalchemy import text  # noqa: E402
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.user import User  # noqa: E402
+from models.chat import Chat, ChatParticipant, Message  # noqa: E402
+from utils.message_search import search_messages  # noqa: E402
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+USERS = 2000
+CHATS = 10000
+REPEATS = 20
+
+WORDS = ('train bus union platform delay late coffee meet car seat window station '
+         'morning evening ticket presto transfer express local weekend lakeshore '
+         'barrie kitchener milton stouffville richmond hill oshawa hamilton').split()
+RARE_WORD = 'zeppelin'
+
+
+def populate():
+    random.seed(42)
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x'}
+            for i in range(1, USERS + 1)
+        ])
+        db.session.execute(Chat.__table__.insert(), [{'id': i} for i in range(1, CHATS + 1)])
+        participants = []
+        for chat_id in range(1, CHATS + 1):
+            a, b = random.sample(range(1, USERS + 1), 2)
+            participants += [{'chat_id': chat_id, 'user_id': a}, {'chat_id': chat_id, 'user_id': b}]
+        db.session.execute(ChatParticipant.__table__.insert(), participants)
+        db.session.commit()
+
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        batch = []
+        for i in range(1, MESSAGES + 1):
+            words = random.choices(WORDS, k=random.randint(4, 14))
+            if i % 10000 == 0:
+                words.append(RARE_WORD)
+            chat_id = random.randint(1, CHATS)
+            batch.append({'chat_id': chat_id, 'sender_id': participants[(chat_id - 1) * 2]['user_id'],
+                          'content': ' '.join(words), 'created_at': now - timedelta(seconds=MESSAGES - i)})
+            if len(batch) == 20000:
+                db.session.execute(Message.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(Message.__table__.insert(), batch)
+        db.session.commit()
+        return time.perf_counter() - start, participants[0]['user_id']
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def main():
+    print(f"Populating {MESSAGES} messages (with FTS triggers)...")
+    elapsed, user_id = populate()
+    print(f"  insert + index: {elapsed:.1f}s")
+
+    with app.app_context():
+        def like_scan(term):
+            return db.session.execute(text(
+                "SELECT m.id FROM messages m JOIN chat_participants cp "
+                "ON cp.chat_id = m.chat_id AND cp.user_id = :user_id "
+                "WHERE m.content LIKE :pattern ORDER BY m.id DESC LIMIT 20"
+            ), {'user_id': user_id, 'pattern': f'%{term}%'}).fetchall()
+
+        print(f"\nSearch latency for one user's chats (median of {REPEATS}, first page of 20)")
+        for label, term in (('rare term', RARE_WORD), ('common term', 'train'), ('two terms', 'late coffee')):
+            fts_ms, (results, cursor) = timed(lambda: search_messages(db.session, user_id, term))
+            like_ms, _ = timed(lambda: like_scan(term.split()[0]))
+            print(f"  {label:<12} FTS5 {fts_ms:8.2f} ms ({len(results)} hits)   LIKE scan {like_ms:8.2f} ms")
+
+        _, (_, cursor) = timed(lambda: search_messages(db.session, user_id, 'train'))
+        if cursor:
+            page_ms, _ = timed(lambda: search_messages(db.session, user_id, 'train', cursor=cursor))
+            print(f"  next page    FTS5 {page_ms:8.2f} ms (keyset cursor)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: chat message throughput with synchronous commits vs write-behind
+group commit, for 1, 10 and 100 concurrent senders.
+
+Uses a throwaway database, run from the backend directory:
+
+    python benchmarks/bench_message_writer.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+os.environ['TRANSIT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'transit.db')}"
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.user import User  # noqa: E402
+from models.chat import Chat, ChatParticipant, Message  # noqa: E402
+from utils.auth import generate_token  # noqa: E402
+
+CLIENT_COUNTS = [1, 10, 100]
+MESSAGES_TOTAL = 1000
+
+
+def setup(clients):
+    """Create one chat per sender, each with a shared second participant"""
+    with app.app_context():
+        db.session.query(Message).delete()
+        db.session.query(ChatParticipant).delete()
+        db.session.query(Chat).delete()
+        db.session.query(User).delete()
+        db.session.add_all([User(id=i, username=f'user{i}', email=f'user{i}@example.com', password='x')
+                            for i in range(clients + 1)])
+        db.session.add_all([Chat(id=i) for i in range(1, clients + 1)])
+        db.session.flush()
+        for i in range(1, clients + 1):
+            db.session.add(ChatParticipant(chat_id=i, user_id=i))
+            db.session.add(ChatParticipant(chat_id=i, user_id=0))
+        db.session.commit()
+
+
+def run(clients, write_behind):
+    setup(clients)
+    app.config['CHAT_WRITE_BEHIND'] = write_behind
+    per_client = max(1, MESSAGES_TOTAL // clients)
+    errors = []
+
+    def sender(user_id):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {generate_token(user_id, app.config["SECRET_KEY"])}'}
+        for n in range(per_client):
+            response = client.post(f'/api/chats/{user_id}/messages',
+                                   json={'content': f'message {n}'}, headers=headers)
+            if response.status_code != 201:
+                errors.append(response.get_json())
+
+    threads = [threading.Thread(target=sender, args=(i,)) for i in range(1, clients + 1)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = per_client * clients
+    return total / elapsed, len(errors)
+
+
+def main():
+    print(f"Chat message throughput ({MESSAGES_TOTAL} messages per run)")
+    print(f"  {'clients':>7}  {'sync msg/s':>12}  {'write-behind msg/s':>19}  {'errors (sync/wb)':>17}")
+    for clients in CLIENT_COUNTS:
+        sync_rate, sync_errors = run(clients, write_behind=False)
+        wb_rate, wb_errors = run(clients, write_behind=True)
+        print(f"  {clients:>7}  {sync_rate:>12.0f}  {wb_rate:>19.0f}  {sync_errors:>8}/{wb_errors}")
+
+
+if __name__ == '__main__':
+    main()
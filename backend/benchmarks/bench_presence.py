@@ -0,0 +1,112 @@
+"""
+Benchmark: 100k heartbeats per minute on one process.
+
+Measures the presence store on its own (100k distinct users heartbeating
+once within a simulated minute, then the same users again, then expiry),
+its memory, batched online lookups, and the heartbeat endpoint through
+the whole Flask stack (JWT check included) to see what share of one core
+100k/minute costs.
+Run from the backend directory:
+
+    python benchmarks/bench_presence.py
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+from app import app  # noqa: E402
+from utils import presence  # noqa: E402
+from utils.auth import generate_token  # noqa: E402
+from utils.presence import TTLWheel  # noqa: E402
+
+USERS = 100_000
+HTTP_REQUESTS = 5_000
+LOOKUP_SIZES = (50, 500)
+
+
+def simulate_minute(wheel, start):
+    """One heartbeat per user, spread evenly over 60 simulated seconds"""
+    begin = time.perf_counter()
+    for user_id in range(USERS):
+        wheel.touch(user_id, now=start + 60.0 * user_id / USERS)
+    return time.perf_counter() - begin
+
+
+def main():
+    start = time.time()
+    clock = {'now': start}
+    wheel = TTLWheel(60, clock=lambda: clock['now'])
+
+    first = simulate_minute(wheel, start)
+    second = simulate_minute(wheel, start + 60)
+    clock['now'] = start + 120
+    live = len(wheel)
+
+    clock['now'] = start + 250
+    begin = time.perf_counter()
+    expired = len(wheel.expire())
+    expire_seconds = time.perf_counter() - begin
+
+    tracemalloc.start()
+    memory_wheel = TTLWheel(60)
+    now = time.time()
+    for user_id in range(USERS):
+        memory_wheel.touch(user_id, now=now)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Presence store, {USERS:,} heartbeats per simulated minute")
+    print(f"  first minute (all new users)   {first * 1000:8.1f} ms CPU  ({first / USERS * 1e6:.2f} µs/heartbeat)")
+    print(f"  second minute (same users)     {second * 1000:8.1f} ms CPU  ({second / USERS * 1e6:.2f} µs/heartbeat)")
+    print(f"  live after two minutes         {live:8,}")
+    print(f"  expire {expired:,} idle users     {expire_seconds * 1000:8.1f} ms")
+    print(f"  memory for {USERS:,} live users  {memory / 1024 / 1024:8.1f} MB")
+
+    presence.activity = memory_wheel
+    for size in LOOKUP_SIZES:
+        users = [{'user_id': user_id} for user_id in range(0, size * 7, 7)]
+        samples = []
+        for _ in range(200):
+            begin = time.perf_counter()
+            presence.mark_online(users)
+            samples.append(time.perf_counter() - begin)
+        print(f"  mark_online, {size} users         {statistics.median(samples) * 1e6:8.0f} µs")
+
+    # Call the WSGI app directly with prebuilt environs, so the test client's
+    # request building isn't counted
+    environs = [
+        EnvironBuilder(path='/api/presence/heartbeat', method='POST', headers={
+            'Authorization': f'Bearer {generate_token(user_id, app.config["SECRET_KEY"])}'
+        }).get_environ()
+        for user_id in range(1000)
+    ]
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    begin = time.perf_counter()
+    for n in range(HTTP_REQUESTS):
+        b''.join(app(dict(environs[n % len(environs)]), start_response))
+    per_request = (time.perf_counter() - begin) / HTTP_REQUESTS
+    assert all(status.startswith('200') for status in statuses)
+    share = per_request * USERS / 60
+
+    print(f"\nPOST /api/presence/heartbeat through the full Flask stack ({HTTP_REQUESTS:,} requests)")
+    print(f"  per request                    {per_request * 1000:8.3f} ms")
+    print(f"  {USERS:,} per minute             {share:8.1%} of one core")
+
+
+if __name__ == '__main__':
+    main()
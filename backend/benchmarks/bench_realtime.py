@@ -0,0 +1,155 @@
+"""
+Benchmark: CPU cost of a full GTFS-realtime refresh into the in-memory store.
+
+Builds a synthetic FULL_DATASET feed for the busiest trips of the
+published static feed, each with stop predictions and a vehicle position,
+and times a refresh when the file is untouched, when it is rewritten
+unchanged, when only timestamps move, and when a share of trips change.
+The feed is written as the GTFS-rt JSON mapping or, with `protobuf`, as the
+binary FeedMessage real producers publish (needs gtfs-realtime-bindings;
+the protobuf parse is first checked against the JSON one). Run from the
+backend directory after `python import_gtfs.py`:
+
+    python benchmarks/bench_realtime.py [trips] [json|protobuf]
+"""
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+
+from app import app  # noqa: E402
+from models.transit import Trip  # noqa: E402
+from utils.realtime import (FeedSource, RealtimeWorker, store, parse_json_feed,  # noqa: E402
+                            parse_protobuf_feed, gtfs_realtime_pb2)
+from utils.transit_store import get_transit_store  # noqa: E402
+
+TRIPS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+FORMAT = sys.argv[2] if len(sys.argv) > 2 else 'json'
+STOPS_PER_TRIP = 10
+CHANGED_SHARE = 0.05
+REPEATS = 20
+
+
+def build_feed(trip_ids, stop_ids, stamp, delays, base):
+    entities = []
+    for n, trip_id in enumerate(trip_ids):
+        trip = {'tripId': trip_id}
+        entities.append({'id': f'tu-{n}', 'tripUpdate': {
+            'trip': trip,
+            'timestamp': str(stamp),
+            'stopTimeUpdate': [{
+                'stopSequence': s + 1,
+                'stopId': stop_ids[(n + s) % len(stop_ids)],
+                'arrival': {'delay': delays[n], 'time': str(base + 300 * (s + 1) + delays[n])},
+                'departure': {'delay': delays[n], 'time': str(base + 300 * (s + 1) + 30 + delays[n])}
+            } for s in range(STOPS_PER_TRIP)]
+        }})
+        entities.append({'id': f'vp-{n}', 'vehicle': {
+            'trip': trip,
+            'vehicle': {'id': f'bus-{n}'},
+            'position': {'latitude': 43.6 + n * 1e-5, 'longitude': -79.4 - delays[n] * 1e-6},
+            'timestamp': str(stamp)
+        }})
+    return json.dumps({'header': {'gtfsRealtimeVersion': '2.0', 'incrementality': 'FULL_DATASET',
+                                  'timestamp': str(stamp)}, 'entity': entities})
+
+
+def encode(feed):
+    """The feed body as written to disk in FORMAT"""
+    if FORMAT == 'json':
+        return feed.encode('utf-8')
+    from google.protobuf import json_format
+    return json_format.Parse(feed, gtfs_realtime_pb2.FeedMessage()).SerializeToString()
+
+
+def check_protobuf(feed):
+    """Parse the same feed both ways and make sure the protobuf path reads what the JSON one does"""
+    from_json = parse_json_feed(json.loads(feed))
+    from_protobuf = parse_protobuf_feed(encode(feed))
+    assert from_protobuf.full == from_json.full
+    assert from_protobuf.updates == from_json.updates, 'trip updates differ between protobuf and JSON'
+    assert from_protobuf.positions.keys() == from_json.positions.keys()
+    for trip_id, position in from_protobuf.positions.items():
+        expected = from_json.positions[trip_id]
+        # Coordinates are float32 in the protobuf
+        assert abs(position.latitude - expected.latitude) < 1e-4
+        assert abs(position.longitude - expected.longitude) < 1e-4
+        assert position._replace(latitude=None, longitude=None) == expected._replace(latitude=None, longitude=None)
+
+
+def main():
+    if FORMAT not in ('json', 'protobuf'):
+        sys.exit(f'Unknown feed format {FORMAT!r}, expected json or protobuf')
+    if FORMAT == 'protobuf' and gtfs_realtime_pb2 is None:
+        sys.exit('The protobuf benchmark needs gtfs-realtime-bindings (pip install -r requirements.txt)')
+
+    with app.app_context():
+        trip_ids = [trip_id for trip_id, in Trip.query.with_entities(Trip.trip_id).limit(TRIPS)]
+        stop_ids = [stop.stop_id for stop in get_transit_store().stops]
+
+    path = os.path.join(TMP_DIR, f'feed.{"json" if FORMAT == "json" else "pb"}')
+    stamp = int(time.time())
+    delays = [0] * len(trip_ids)
+
+    if FORMAT == 'protobuf':
+        check_protobuf(build_feed(trip_ids, stop_ids, stamp, delays, stamp))
+
+    def write(feed):
+        with open(path, 'wb') as f:
+            f.write(encode(feed))
+        os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+    worker = RealtimeWorker(app, FeedSource(path), interval=None)
+    published = []
+    store.subscribe(lambda version, delta: published.append(len(delta)))
+
+    write(build_feed(trip_ids, stop_ids, stamp, delays, stamp))
+    start = time.perf_counter()
+    worker.poll()
+    initial_ms = (time.perf_counter() - start) * 1000
+
+    def timed(prepare):
+        samples = []
+        published.clear()
+        for i in range(REPEATS):
+            prepare(i)
+            start = time.perf_counter()
+            worker.poll()
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples) * 1000, statistics.median(published) if published else 0
+
+    def restamp(i):
+        write(build_feed(trip_ids, stop_ids, stamp + 30 * (i + 1), delays, stamp))
+
+    def change_some(i):
+        for n in range(i, len(delays), int(1 / CHANGED_SHARE)):
+            delays[n] += 60
+        write(build_feed(trip_ids, stop_ids, stamp, delays, stamp))
+
+    untouched = timed(lambda i: None)
+    rewritten = timed(lambda i: write(build_feed(trip_ids, stop_ids, stamp, delays, stamp)))
+    restamped = timed(restamp)
+    changed = timed(change_some)
+
+    size_kb = os.path.getsize(path) / 1024
+    print(f"Full refresh of {len(trip_ids)} trips ({STOPS_PER_TRIP} stop predictions + position each, "
+          f"{size_kb:.0f} KB {FORMAT}), median of {REPEATS}")
+    print(f"  {'refresh':<34} {'ms':>8} {'published trips':>16}")
+    print(f"  {'first load':<34} {initial_ms:>8.1f} {len(trip_ids):>16}")
+    print(f"  {'file untouched':<34} {untouched[0]:>8.2f} {untouched[1]:>16.0f}")
+    print(f"  {'rewritten, same bytes':<34} {rewritten[0]:>8.2f} {rewritten[1]:>16.0f}")
+    print(f"  {'only timestamps changed':<34} {restamped[0]:>8.1f} {restamped[1]:>16.0f}")
+    print(f"  {f'{CHANGED_SHARE:.0%} of trips delayed further':<34} {changed[0]:>8.1f} {changed[1]:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: cold-load of transit data from the binary snapshot vs the ORM.
+
+Each measurement runs in a fresh interpreter so nothing is cached in-process.
+Run from the backend directory after `python import_gtfs.py`:
+
+    python benchmarks/bench_snapshot.py
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RUNS = 5
+
+
+def load_orm():
+    from app import app
+    from models.transit import Route, Stop, Trip
+
+    with app.app_context():
+        start = time.perf_counter()
+        routes = Route.query.all()
+        stops = Stop.query.all()
+        trips = Trip.query.all()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(routes) + len(stops) + len(trips)
+
+
+def load_snapshot(decode):
+    from app import app
+    from models.transit import TransitSnapshot
+    from utils import feed
+
+    with app.app_context():
+        path = feed.current_snapshot_path()
+
+    start = time.perf_counter()
+    snapshot = TransitSnapshot(path)
+    count = 0
+    if decode:
+        for name in ('routes', 'stops', 'trips'):
+            for _ in snapshot[name]:
+                count += 1
+    else:
+        # Usable: one keyed lookup per table
+        for name, key in (('routes', 'route_id'), ('stops', 'stop_id'), ('trips', 'trip_id')):
+            table = snapshot[name]
+            table.value(key, len(table) - 1)
+            count += len(table)
+    elapsed = time.perf_counter() - start
+    return elapsed, count
+
+
+def run(variant):
+    output = subprocess.run(
+        [sys.executable, __file__, variant], capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    elapsed, count = output.split()
+    return float(elapsed), int(count)
+
+
+def main():
+    if len(sys.argv) > 1:
+        variant = sys.argv[1]
+        if variant == 'orm':
+            elapsed, count = load_orm()
+        else:
+            elapsed, count = load_snapshot(decode=(variant == 'snapshot-decode'))
+        print(f"{elapsed} {count}")
+        return
+
+    print(f"Cold load of routes + stops + trips (median of {RUNS} fresh processes)")
+    for variant, label in (('orm', 'ORM query .all()'),
+                           ('snapshot', 'snapshot mmap (usable)'),
+                           ('snapshot-decode', 'snapshot mmap + decode all rows')):
+        results = [run(variant) for _ in range(RUNS)]
+        median = statistics.median(elapsed for elapsed, _ in results)
+        print(f"  {label:<34} {median * 1000:9.2f} ms  ({results[0][1]} rows)")
+
+
+if __name__ == '__main__':
+    main()
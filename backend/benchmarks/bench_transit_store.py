@@ -0,0 +1,96 @@
+"""
+Benchmark: the in-memory transit store vs ORM instances, for memory and for
+serializing a user's routes (the work behind /api/user/routes).
+
+Uses a throwaway chat database and the published transit feed, so run from
+the backend directory after `python import_gtfs.py`:
+
+    python benchmarks/bench_transit_store.py
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['CHAT_DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'chat.db')}"
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.user import User  # noqa: E402
+from models.transit import Route, Stop  # noqa: E402
+from models.user_route import UserRoute  # noqa: E402
+from utils.auth import generate_token  # noqa: E402
+from utils.transit_store import TransitStore, get_transit_store  # noqa: E402
+
+USER_ROUTES = 20
+REPEATS = 200
+
+
+def measure_memory(load):
+    """Bytes still allocated by whatever load() returns"""
+    tracemalloc.start()
+    result = load()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    with app.app_context():
+        orm_bytes, orm = measure_memory(lambda: (Route.query.all(), Stop.query.all()))
+        count = len(orm[0]) + len(orm[1])
+        db.session.expunge_all()
+        store_bytes, _ = measure_memory(TransitStore.load)
+
+        print(f"Routes + stops resident ({count} records)")
+        print(f"  ORM instances   {orm_bytes / 1024:8.0f} KB")
+        print(f"  transit store   {store_bytes / 1024:8.0f} KB")
+
+        route_ids = [route.route_id for route in get_transit_store().routes[:USER_ROUTES]]
+        db.session.add(User(id=1, username='user1', email='user1@example.com', password='x'))
+        db.session.add_all([UserRoute(user_id=1, route_id=route_id) for route_id in route_ids])
+        db.session.commit()
+
+        def orm_serialize():
+            # The previous UserRoute.to_dict(): one lazy Route load per row
+            user_routes = UserRoute.query.filter_by(user_id=1).all()
+            result = [{**ur.to_dict(), 'route': ur.route.to_dict()} for ur in user_routes]
+            db.session.remove()
+            return result
+
+        def store_serialize():
+            result = [ur.to_dict() for ur in UserRoute.query.filter_by(user_id=1).all()]
+            db.session.remove()
+            return result
+
+        orm_ms = timed(orm_serialize)
+        store_ms = timed(store_serialize)
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {generate_token(1, app.config["SECRET_KEY"])}'}
+    endpoint_ms = timed(lambda: client.get('/api/user/routes', headers=headers))
+
+    print(f"\n/api/user/routes with {USER_ROUTES} routes (median of {REPEATS})")
+    print(f"  serialize via ORM lazy loads   {orm_ms:6.2f} ms")
+    print(f"  serialize via transit store    {store_ms:6.2f} ms")
+    print(f"  full request (store)           {endpoint_ms:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,8 +12,60 @@ class Config:
         raise ValueError("SECRET_KEY environment variable must be set!")
 
     # Database
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('CHAT_DATABASE_URL', 'sqlite:///database.db')
+    # Transit (GTFS) data lives in its own file so imports never contend with chat writes.
+    # The importer publishes versioned copies of it, see utils/feed.py
+    SQLALCHEMY_BINDS = {'transit': os.environ.get('TRANSIT_DATABASE_URL', 'sqlite:///transit.db')}
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Chat write-behind: queue messages and group-commit them (see utils/message_writer.py)
+    CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND') == '1'
+    CHAT_FLUSH_MAX_MESSAGES = int(os.environ.get('CHAT_FLUSH_MAX_MESSAGES', 100))
+
+    # Message tiering: archive_messages.py moves messages older than this into compressed blocks
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+    MESSAGE_ARCHIVE_BLOCK_SIZE = int(os.environ.get('MESSAGE_ARCHIVE_BLOCK_SIZE', 500))
+
+    # Compress buffered JSON responses larger than this (bytes); streamed ones always are
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+    # /api/batch: sub-request limit, and threads used to run independent reads concurrently
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))
+
+    # Profiling (see utils/profiling.py): ?__profile=1 with an X-Admin-Token header profiles
+    # one request; PROFILE_SAMPLING=1 writes sampled stacks to PROFILE_OUTPUT.<pid>
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+    PROFILE_SAMPLING = os.environ.get('PROFILE_SAMPLING') == '1'
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 10))
+    PROFILE_FLUSH_SECONDS = int(os.environ.get('PROFILE_FLUSH_SECONDS', 30))
+    PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', 'profile.collapsed')
+
+    # GTFS-realtime (see utils/realtime.py): TripUpdate/VehiclePosition feed, a file path or
+    # http(s) URL, polled every REALTIME_POLL_SECONDS. /api/realtime/changes can answer with
+    # just the changes for clients up to REALTIME_CHANGE_HISTORY versions behind
+    REALTIME_FEED_URL = os.environ.get('REALTIME_FEED_URL')
+    REALTIME_POLL_SECONDS = int(os.environ.get('REALTIME_POLL_SECONDS', 20))
+    REALTIME_CHANGE_HISTORY = int(os.environ.get('REALTIME_CHANGE_HISTORY', 100))
+
+    # Background jobs (see utils/jobs.py): run in each web worker with JOBS_IN_PROCESS=1,
+    # or as a sidecar with `python run_jobs.py`. JOB_SCHEDULE is "m h dom mon dow job; ..." in UTC
+    JOBS_IN_PROCESS = os.environ.get('JOBS_IN_PROCESS') == '1'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+    JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', 30))
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))
+    JOB_SCHEDULE = os.environ.get(
+        'JOB_SCHEDULE', '15 3 * * * archive_messages; 45 3 * * * analyze; 0 4 * * 0 vacuum'
+    )
+    # Web workers apply rebuild_indexes / warm_caches runs to their own caches (utils/job_handlers.py);
+    # run_jobs.py and the other scripts turn this off
+    PROCESS_REFRESH = os.environ.get('PROCESS_REFRESH', '1') == '1'
+
+    # Presence (see utils/presence.py): users are online for this long after their last
+    # authenticated request or heartbeat; typing indicators expire after TYPING_TTL_SECONDS
+    PRESENCE_TTL_SECONDS = int(os.environ.get('PRESENCE_TTL_SECONDS', 60))
+    TYPING_TTL_SECONDS = int(os.environ.get('TYPING_TTL_SECONDS', 5))
+
     # Debug - only True if ENV is not production
     DEBUG = os.environ.get('ENV') != 'production'
@@ -1,18 +1,43 @@
 """
-Script to import GTFS data from text files into the database.
-Run this script to populate the Routes, Stops, Trips, and StopTimes tables.
+Script to import GTFS data from text files into the transit database.
+Run this script to build the Routes, Stops, Trips, StopTimes and CalendarDates tables.
+
+The feed is built into a fresh shadow SQLite file (indexes are created after
+the bulk load), checked for integrity and then published atomically, so the
+API never serves a partially imported feed. Running workers pick up the new
+version on their next request, see utils/feed.py.
 """
 
 import csv
 import os
+import statistics
+import time
 from datetime import datetime
-from app import app
-from models import db
-from models.transit import Route, Stop, Trip, StopTime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.schema import CreateTable
+
+# Scripts don't serve requests, so they have no caches to refresh (see PROCESS_REFRESH)
+os.environ.setdefault('PROCESS_REFRESH', '0')
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.transit import Route, RouteStats, Stop, Trip, StopTime, CalendarDate, AMENITY_BITS, AMENITY_WHEELCHAIR, write_snapshot  # noqa: E402
+from utils import feed  # noqa: E402
+
+BATCH_SIZE = 5000
+
+
+def parse_seconds(time_str):
+    """Seconds from the start of the service day for a GTFS time (HH:MM:SS), kept past 24:00:00"""
+    if not time_str or time_str.strip() == '':
+        return None
+
+    hours, minutes, seconds = map(int, time_str.strip().split(':'))
+    return hours * 3600 + minutes * 60 + seconds
 
 
 def parse_time(time_str):
-    """Parse GTFS time format (HH:MM:SS) which can exceed 24 hours"""
+    """Parse GTFS time format (HH:MM:SS) which can exceed 24 hours, as a time of day"""
     if not time_str or time_str.strip() == '':
         return None
 
@@ -22,132 +47,299 @@ def parse_time(time_str):
     seconds = int(parts[2])
 
     # GTFS allows hours > 24 for trips that go past midnight
-    # We'll normalize to 24-hour format
+    # We'll normalize to 24-hour format (parse_seconds keeps the real offset)
     hours = hours % 24
 
     return datetime.strptime(f"{hours:02d}:{minutes:02d}:{seconds:02d}", "%H:%M:%S").time()
 
 
-def import_routes(data_dir):
-    """Import routes from routes.txt"""
-    print("Importing routes...")
+def read_csv(data_dir, filename):
+    """Yield rows of a GTFS text file as dicts"""
+    with open(os.path.join(data_dir, filename), 'r', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def read_routes(data_dir):
+    """Read routes from routes.txt"""
+    for row in read_csv(data_dir, 'routes.txt'):
+        yield {
+            'route_id': row['route_id'],
+            'agency_id': row['agency_id'],
+            'route_short_name': row['route_short_name'],
+            'route_long_name': row['route_long_name'],
+            'route_type': int(row['route_type']),
+            'route_color': row.get('route_color'),
+            'route_text_color': row.get('route_text_color')
+        }
+
+
+def load_stop_amenities(data_dir):
+    """Load stop_amentities.txt into a {stop_id: amenity bitmask} dict"""
+    masks = {}
+    if not os.path.exists(os.path.join(data_dir, 'stop_amentities.txt')):
+        return masks
+
+    for row in read_csv(data_dir, 'stop_amentities.txt'):
+        mask = 0
+        for name, bit in AMENITY_BITS.items():
+            if row.get(name, '').strip() == '1':
+                mask |= bit
+        masks[row['stop_id']] = mask
+
+    return masks
+
+
+def read_stops(data_dir):
+    """Read stops from stops.txt, folding in amenities from stop_amentities.txt"""
+    amenity_masks = load_stop_amenities(data_dir)
+
+    for row in read_csv(data_dir, 'stops.txt'):
+        wheelchair_boarding = int(row['wheelchair_boarding']) if row.get('wheelchair_boarding') else None
+        amenities = amenity_masks.get(row['stop_id'], 0)
+        if wheelchair_boarding == 1:
+            amenities |= AMENITY_WHEELCHAIR
+
+        yield {
+            'stop_id': row['stop_id'],
+            'stop_name': row['stop_name'],
+            'stop_lat': float(row['stop_lat']),
+            'stop_lon': float(row['stop_lon']),
+            'zone_id': row.get('zone_id'),
+            'stop_url': row.get('stop_url'),
+            'location_type': int(row['location_type']) if row.get('location_type') else None,
+            'parent_station': row.get('parent_station'),
+            'wheelchair_boarding': wheelchair_boarding,
+            'stop_code': row.get('stop_code'),
+            'amenities': amenities
+        }
+
+
+def read_trips(data_dir):
+    """Read trips from trips.txt"""
+    for row in read_csv(data_dir, 'trips.txt'):
+        yield {
+            'trip_id': row['trip_id'],
+            'route_id': row['route_id'],
+            'service_id': row['service_id'],
+            'trip_headsign': row.get('trip_headsign'),
+            'trip_short_name': row.get('trip_short_name'),
+            'direction_id': int(row['direction_id']) if row.get('direction_id') else None,
+            'block_id': row.get('block_id'),
+            'shape_id': row.get('shape_id'),
+            'wheelchair_accessible': int(row['wheelchair_accessible']) if row.get('wheelchair_accessible') else None,
+            'bikes_allowed': int(row['bikes_allowed']) if row.get('bikes_allowed') else None,
+            'route_variant': row.get('route_variant')
+        }
+
+
+def read_calendar_dates(data_dir):
+    """Read service dates from calendar_dates.txt"""
+    for row in read_csv(data_dir, 'calendar_dates.txt'):
+        yield {
+            'service_id': row['service_id'],
+            'date': datetime.strptime(row['date'].strip(), '%Y%m%d').date(),
+            'exception_type': int(row['exception_type'])
+        }
+
+
+def read_stop_times(data_dir):
+    """Read stop times from stop_times.txt (WARNING: This is a large file!)"""
+    for row in read_csv(data_dir, 'stop_times.txt'):
+        arrival_time = parse_time(row['arrival_time'])
+        departure_time = parse_time(row['departure_time'])
+
+        if arrival_time and departure_time:
+            yield {
+                'trip_id': row['trip_id'],
+                'stop_id': row['stop_id'],
+                'arrival_time': arrival_time,
+                'departure_time': departure_time,
+                'arrival_seconds': parse_seconds(row['arrival_time']),
+                'departure_seconds': parse_seconds(row['departure_time']),
+                'stop_sequence': int(row['stop_sequence']),
+                'pickup_type': int(row['pickup_type']) if row.get('pickup_type') else 0,
+                'drop_off_type': int(row['drop_off_type']) if row.get('drop_off_type') else 0,
+                'stop_headsign': row.get('stop_headsign')
+            }
+
+
+def bulk_load(conn, model, rows, label):
+    """Insert rows into a model's table in executemany batches"""
+    print(f"Importing {label}...")
+    table = model.__table__
     count = 0
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(table.insert(), batch)
+            count += len(batch)
+            batch = []
+            if count % 50000 == 0:
+                print(f"  {count} {label} imported...")
+
+    if batch:
+        conn.execute(table.insert(), batch)
+        count += len(batch)
+
+    print(f"[OK] Imported {count} {label}")
+    return count
+
+
+def read_feed_version(data_dir):
+    """Build a unique version string from feed_info.txt and the current time"""
+    feed_version = 'gtfs'
+    if os.path.exists(os.path.join(data_dir, 'feed_info.txt')):
+        for row in read_csv(data_dir, 'feed_info.txt'):
+            feed_version = row.get('feed_version') or feed_version
+    return f"{feed_version}-{int(time.time())}"
+
+
+def check_integrity(conn):
+    """Run integrity checks on a freshly built transit database. Raises on failure."""
+    result = conn.execute(text("PRAGMA integrity_check")).scalar()
+    if result != 'ok':
+        raise RuntimeError(f"integrity_check failed: {result}")
+
+    violations = conn.execute(text("PRAGMA foreign_key_check")).fetchall()
+    if violations:
+        raise RuntimeError(f"foreign_key_check found {len(violations)} dangling references, "
+                           f"e.g. {tuple(violations[0])}")
+
+    for model in (Route, Stop, Trip):
+        count = conn.execute(text(f"SELECT COUNT(*) FROM {model.__tablename__}")).scalar()
+        if count == 0:
+            raise RuntimeError(f"{model.__tablename__} is empty")
+
+
+def compute_route_stats(conn, has_stop_times):
+    """Yield RouteStats rows: per route, service day and direction, using GROUP BY in SQLite.
+
+    Departure times and headways come from each trip's first stop, so they
+    are only available when the feed includes stop_times.txt. They use the
+    unwrapped GTFS times, so service after midnight (25:10) stays at the end
+    of its service day rather than wrapping to 01:10.
+    """
+    departures = {}
+    if has_stop_times:
+        # Bare departure_time with MIN(stop_sequence) is taken from the trip's first stop
+        rows = conn.execute(text(
+            "SELECT t.route_id, t.service_id, t.direction_id, first.departure_seconds "
+            "FROM (SELECT trip_id, departure_seconds, MIN(stop_sequence) FROM stop_times GROUP BY trip_id) AS first "
+            "JOIN trips t ON t.trip_id = first.trip_id"
+        ))
+        for route_id, service_id, direction_id, departure_seconds in rows:
+            departures.setdefault((route_id, service_id, direction_id), []).append(departure_seconds // 60)
+
+    counts = conn.execute(text(
+        "SELECT route_id, service_id, direction_id, COUNT(*) FROM trips "
+        "GROUP BY route_id, service_id, direction_id"
+    ))
+    for route_id, service_id, direction_id, trip_count in counts:
+        row = {
+            'route_id': route_id,
+            'service_id': service_id,
+            'direction_id': direction_id,
+            'trip_count': trip_count,
+            'first_departure': None,
+            'last_departure': None,
+            'median_headway': None,
+            'hourly_trips': None
+        }
+        times = sorted(departures.get((route_id, service_id, direction_id), ()))
+        if times:
+            # One bucket per hour of the service day; more than 24 when it runs past midnight
+            hourly = [0] * max(24, times[-1] // 60 + 1)
+            for minutes in times:
+                hourly[minutes // 60] += 1
+            row['first_departure'] = times[0]
+            row['last_departure'] = times[-1]
+            if len(times) > 1:
+                row['median_headway'] = float(statistics.median(b - a for a, b in zip(times, times[1:])))
+            row['hourly_trips'] = ','.join(map(str, hourly))
+        yield row
+
+
+def build_transit_db(data_dir, path, snapshot_path, version):
+    """Build a complete transit database (and its binary snapshot) from GTFS files"""
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, 'connect')
+    def fast_bulk_load(dbapi_connection, connection_record):
+        # The shadow file is thrown away if anything fails, so skip the journal and fsyncs
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=OFF")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.close()
+
+    tables = db.metadatas['transit'].sorted_tables
+
+    with engine.begin() as conn:
+        # Create tables first and indexes only after the bulk load
+        for table in tables:
+            conn.execute(CreateTable(table))
+
+        bulk_load(conn, Route, read_routes(data_dir), 'routes')
+        bulk_load(conn, Stop, read_stops(data_dir), 'stops')
+        bulk_load(conn, Trip, read_trips(data_dir), 'trips')
+        if os.path.exists(os.path.join(data_dir, 'calendar_dates.txt')):
+            bulk_load(conn, CalendarDate, read_calendar_dates(data_dir), 'calendar dates')
+        has_stop_times = os.path.exists(os.path.join(data_dir, 'stop_times.txt'))
+        if has_stop_times:
+            bulk_load(conn, StopTime, read_stop_times(data_dir), 'stop times')
+
+        print("Creating indexes...")
+        for table in tables:
+            for index in table.indexes:
+                index.create(conn)
+
+        start = time.time()
+        bulk_load(conn, RouteStats, list(compute_route_stats(conn, has_stop_times)), 'route stats')
+        print(f"  computed in {time.time() - start:.2f}s")
+
+    with engine.connect() as conn:
+        print("Checking integrity...")
+        check_integrity(conn)
+        conn.execute(text("ANALYZE"))
+        conn.commit()
+
+        print("Writing binary snapshot...")
+        write_snapshot(conn, snapshot_path, version, [Route, Stop, Trip, StopTime])
+
+    engine.dispose()
+
+    # Make sure everything is on disk before the file is published
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def import_feed(data_dir, progress=None):
+    """Build the feed in data_dir and publish it. Returns the new version.
+
+    progress(fraction, message) is called between stages (e.g. by the
+    import_feed background job, see utils/job_handlers.py).
+    """
+    progress = progress or (lambda fraction, message: None)
 
-    with open(os.path.join(data_dir, 'routes.txt'), 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            route = Route(
-                route_id=row['route_id'],
-                agency_id=row['agency_id'],
-                route_short_name=row['route_short_name'],
-                route_long_name=row['route_long_name'],
-                route_type=int(row['route_type']),
-                route_color=row.get('route_color'),
-                route_text_color=row.get('route_text_color')
-            )
-            db.session.add(route)
-            count += 1
-
-            if count % 10 == 0:
-                db.session.commit()
-
-    db.session.commit()
-    print(f"[OK] Imported {count} routes")
-
-
-def import_stops(data_dir):
-    """Import stops from stops.txt"""
-    print("Importing stops...")
-    count = 0
-
-    with open(os.path.join(data_dir, 'stops.txt'), 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            stop = Stop(
-                stop_id=row['stop_id'],
-                stop_name=row['stop_name'],
-                stop_lat=float(row['stop_lat']),
-                stop_lon=float(row['stop_lon']),
-                zone_id=row.get('zone_id'),
-                stop_url=row.get('stop_url'),
-                location_type=int(row['location_type']) if row.get('location_type') else None,
-                parent_station=row.get('parent_station'),
-                wheelchair_boarding=int(row['wheelchair_boarding']) if row.get('wheelchair_boarding') else None,
-                stop_code=row.get('stop_code')
-            )
-            db.session.add(stop)
-            count += 1
-
-            if count % 50 == 0:
-                db.session.commit()
-
-    db.session.commit()
-    print(f"[OK] Imported {count} stops")
-
-
-def import_trips(data_dir):
-    """Import trips from trips.txt"""
-    print("Importing trips...")
-    count = 0
+    with app.app_context():
+        transit_dir = os.path.dirname(db.engines['transit'].url.database)
 
-    with open(os.path.join(data_dir, 'trips.txt'), 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            trip = Trip(
-                trip_id=row['trip_id'],
-                route_id=row['route_id'],
-                service_id=row['service_id'],
-                trip_headsign=row.get('trip_headsign'),
-                trip_short_name=row.get('trip_short_name'),
-                direction_id=int(row['direction_id']) if row.get('direction_id') else None,
-                block_id=row.get('block_id'),
-                shape_id=row.get('shape_id'),
-                wheelchair_accessible=int(row['wheelchair_accessible']) if row.get('wheelchair_accessible') else None,
-                bikes_allowed=int(row['bikes_allowed']) if row.get('bikes_allowed') else None,
-                route_variant=row.get('route_variant')
-            )
-            db.session.add(trip)
-            count += 1
-
-            if count % 500 == 0:
-                db.session.commit()
-                print(f"  {count} trips imported...")
-
-    db.session.commit()
-    print(f"[OK] Imported {count} trips")
-
-
-def import_stop_times(data_dir):
-    """Import stop times from stop_times.txt (WARNING: This is a large file!)"""
-    print("Importing stop times (this may take a while)...")
-    count = 0
+    version = read_feed_version(data_dir)
+    build_path = os.path.join(transit_dir, f"transit-{version}.db.building")
+    snapshot_path = os.path.join(transit_dir, f"transit-{version}.snap.building")
 
-    with open(os.path.join(data_dir, 'stop_times.txt'), 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            arrival_time = parse_time(row['arrival_time'])
-            departure_time = parse_time(row['departure_time'])
-
-            if arrival_time and departure_time:
-                stop_time = StopTime(
-                    trip_id=row['trip_id'],
-                    stop_id=row['stop_id'],
-                    arrival_time=arrival_time,
-                    departure_time=departure_time,
-                    stop_sequence=int(row['stop_sequence']),
-                    pickup_type=int(row['pickup_type']) if row.get('pickup_type') else 0,
-                    drop_off_type=int(row['drop_off_type']) if row.get('drop_off_type') else 0,
-                    stop_headsign=row.get('stop_headsign')
-                )
-                db.session.add(stop_time)
-                count += 1
-
-                if count % 1000 == 0:
-                    db.session.commit()
-                    print(f"  {count} stop times imported...")
-
-    db.session.commit()
-    print(f"[OK] Imported {count} stop times")
+    try:
+        progress(0.0, f"Building feed version {version}")
+        build_transit_db(data_dir, build_path, snapshot_path, version)
+        progress(0.9, "Publishing")
+        feed.publish(transit_dir, build_path, version, snapshot_path)
+    except Exception:
+        for path in (build_path, snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return version
 
 
 def main():
@@ -162,36 +354,26 @@ def main():
     print("GO Transit GTFS Data Import")
     print("="*60 + "\n")
 
-    with app.app_context():
-        # Check if data already exists
-        existing_routes = Route.query.count()
-        if existing_routes > 0:
-            print(f"[INFO] Database already contains {existing_routes} routes.")
-            print("Clearing existing data...")
-            Trip.query.delete()
-            Route.query.delete()
-            db.session.commit()
-            print("[OK] Cleared existing data\n")
-
-        # Import data (only routes and trips)
-        try:
-            import_routes(data_dir)
-            import_trips(data_dir)
-
-            print("\n" + "="*60)
-            print("[SUCCESS] Import completed successfully!")
-            print("="*60 + "\n")
-
-            # Show summary
+    try:
+        start = time.time()
+        version = import_feed(data_dir)
+
+        print("\n" + "="*60)
+        print(f"[SUCCESS] Published feed version {version} in {time.time() - start:.1f}s")
+        print("="*60 + "\n")
+
+        # Show summary
+        with app.app_context():
+            feed.check_for_new_version(db.engines['transit'])
             print("Database summary:")
             print(f"  Routes: {Route.query.count()}")
+            print(f"  Stops: {Stop.query.count()}")
             print(f"  Trips: {Trip.query.count()}")
             print()
 
-        except Exception as e:
-            print(f"\n[ERROR] Error during import: {e}")
-            db.session.rollback()
-            raise
+    except Exception as e:
+        print(f"\n[ERROR] Error during import, current feed left untouched: {e}")
+        raise
 
 
 if __name__ == '__main__':
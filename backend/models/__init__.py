@@ -4,6 +4,9 @@ db = SQLAlchemy()
 
 # Import models to register them with SQLAlchemy
 from models.user import User
-from models.transit import Route, Stop, Trip, StopTime
+from models.transit import Route, Stop, Trip, StopTime, CalendarDate, RouteStats
 from models.user_route import UserRoute
-from models.chat import Chat, ChatParticipant, Message
+from models.chat import Chat, ChatParticipant, Message, MessageArchive
+from models.commute import Commute
+from models.job import Job
+from models.data_version import DataVersion
@@ -108,3 +108,31 @@ class Message(db.Model):
             'content': self.content,
             'created_at': self.created_at.isoformat() + 'Z'  # Add Z to indicate UTC
         }
+
+
+class MessageArchive(db.Model):
+    """Block of archived (cold) messages from one chat, packed and compressed.
+
+    Blocks hold consecutive messages in (created_at, id) order; every archived
+    message in a chat is older than every message still in the messages table.
+    See utils/message_archive.py for the format.
+    """
+
+    __tablename__ = 'message_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chats.id'), nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    first_created_at = db.Column(db.DateTime, nullable=False)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_created_at = db.Column(db.DateTime, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    codec = db.Column(db.String(10), nullable=False)  # 'zlib' or 'zstd'
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_archive_chat_first', 'chat_id', 'first_created_at', 'first_message_id'),
+    )
+
+    def __repr__(self):
+        return f'<MessageArchive chat_id={self.chat_id} messages={self.message_count}>'
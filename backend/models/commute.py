@@ -0,0 +1,47 @@
+from models import db
+from datetime import datetime
+
+
+# Day-of-week bits for Commute.days (Monday = bit 0)
+DAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+DAY_BITS = {name: 1 << i for i, name in enumerate(DAY_NAMES)}
+ALL_DAYS = (1 << len(DAY_NAMES)) - 1
+
+
+def format_minutes(minutes):
+    """Format minutes since midnight as HH:MM"""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class Commute(db.Model):
+    """Model for a user's regular commute (origin, destination, departure window and days)"""
+
+    __tablename__ = 'commutes'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    origin_stop_id = db.Column(db.String(50), nullable=False)       # stops.stop_id (transit database)
+    destination_stop_id = db.Column(db.String(50), nullable=False)  # stops.stop_id (transit database)
+    depart_after = db.Column(db.Integer, nullable=False)   # minutes since midnight
+    depart_before = db.Column(db.Integer, nullable=False)  # minutes since midnight
+    days = db.Column(db.Integer, nullable=False)           # DAY_BITS bitmask
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    user = db.relationship('User', backref=db.backref('commutes', lazy='dynamic'))
+
+    def __repr__(self):
+        return f'<Commute user_id={self.user_id} {self.origin_stop_id}->{self.destination_stop_id}>'
+
+    def to_dict(self):
+        """Convert commute object to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'origin_stop_id': self.origin_stop_id,
+            'destination_stop_id': self.destination_stop_id,
+            'depart_after': format_minutes(self.depart_after),
+            'depart_before': format_minutes(self.depart_before),
+            'days': [name for name in DAY_NAMES if self.days & DAY_BITS[name]],
+            'created_at': self.created_at.isoformat()
+        }
@@ -0,0 +1,13 @@
+from models import db
+
+
+class DataVersion(db.Model):
+    """Change counter for a table (bumped in the same transaction as each write to it) or an event (see utils/data_version.py)"""
+
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)  # usually the table's name
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
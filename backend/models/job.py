@@ -0,0 +1,66 @@
+from models import db
+from datetime import datetime
+import json
+
+
+class Job(db.Model):
+    """Model for background jobs run by utils/jobs.py"""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(50), nullable=False)  # registered handler
+    args = db.Column(db.Text)  # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not claimed before this
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    # Set for scheduled runs ("<handler>@<minute>"), so each run is only enqueued once across processes
+    dedupe_key = db.Column(db.String(100), unique=True)
+    progress = db.Column(db.Float)  # 0..1
+    progress_message = db.Column(db.String(200))
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))  # host:pid:thread of the worker running it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # running jobs with a stale heartbeat are requeued
+    finished_at = db.Column(db.DateTime)
+
+    # Claiming the next due job is a range scan on this index
+    __table_args__ = (
+        db.Index('idx_job_status_run_at', 'status', 'run_at'),
+        db.Index('idx_job_name_created', 'name', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+    @property
+    def duration(self):
+        """Seconds the last attempt ran for (so far, if still running)"""
+        if self.started_at is None:
+            return None
+        end = self.finished_at or datetime.utcnow()
+        return (end - self.started_at).total_seconds()
+
+    def to_dict(self):
+        """Convert job object to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'args': json.loads(self.args) if self.args else {},
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'worker': self.worker,
+            'run_at': self.run_at.isoformat() + 'Z',
+            'created_at': self.created_at.isoformat() + 'Z',
+            'started_at': self.started_at.isoformat() + 'Z' if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() + 'Z' if self.finished_at else None,
+            'duration': round(self.duration, 3) if self.duration is not None else None
+        }
@@ -1,11 +1,42 @@
+import json
+import mmap
+import os
+import statistics
+import struct
+from array import array
 from models import db
 from datetime import time
+from sqlalchemy import select
+from models.commute import format_minutes
+from utils import feed
+
+
+# Stop amenity bits, packed into Stop.amenities (one small int per stop)
+AMENITY_SHELTER = 1 << 0
+AMENITY_WASHROOM = 1 << 1
+AMENITY_BIKE_RACK = 1 << 2
+AMENITY_BENCH = 1 << 3
+AMENITY_WHEELCHAIR = 1 << 4
+
+AMENITY_BITS = {
+    'shelter': AMENITY_SHELTER,
+    'washroom': AMENITY_WASHROOM,
+    'bike_rack': AMENITY_BIKE_RACK,
+    'bench': AMENITY_BENCH,
+    'wheelchair': AMENITY_WHEELCHAIR,
+}
+
+
+def amenity_names(mask):
+    """Expand an amenity bitmask into a list of amenity names"""
+    return [name for name, bit in AMENITY_BITS.items() if mask & bit]
 
 
 class Route(db.Model):
     """Model for GO Transit routes (trains and buses)"""
 
     __tablename__ = 'routes'
+    __bind_key__ = 'transit'
 
     route_id = db.Column(db.String(50), primary_key=True)
     agency_id = db.Column(db.String(10))
@@ -16,7 +47,7 @@ class Route(db.Model):
     route_text_color = db.Column(db.String(6))
 
     # Relationship to trips
-    trips = db.relationship('Trip', back_populates='route', lazy='dynamic')
+    trips = db.relationship('Trip', back_populates='route', lazy='dynamic', order_by='Trip.trip_id')
 
     def __repr__(self):
         return f'<Route {self.route_short_name} - {self.route_long_name}>'
@@ -29,7 +60,8 @@ class Route(db.Model):
             'route_long_name': self.route_long_name,
             'route_type': 'train' if self.route_type == 2 else 'bus',
             'route_color': self.route_color,
-            'route_text_color': self.route_text_color
+            'route_text_color': self.route_text_color,
+            'service': get_route_service().get(self.route_id)
         }
 
 
@@ -37,6 +69,7 @@ class Stop(db.Model):
     """Model for GO Transit stops/stations"""
 
     __tablename__ = 'stops'
+    __bind_key__ = 'transit'
 
     stop_id = db.Column(db.String(50), primary_key=True)
     stop_name = db.Column(db.String(200), nullable=False)
@@ -48,6 +81,7 @@ class Stop(db.Model):
     parent_station = db.Column(db.String(50))
     wheelchair_boarding = db.Column(db.Integer)
     stop_code = db.Column(db.String(20))
+    amenities = db.Column(db.SmallInteger, nullable=False, default=0)  # AMENITY_* bits
 
     # Relationship to stop times
     stop_times = db.relationship('StopTime', back_populates='stop', lazy='dynamic')
@@ -63,7 +97,8 @@ class Stop(db.Model):
             'stop_lat': self.stop_lat,
             'stop_lon': self.stop_lon,
             'wheelchair_boarding': self.wheelchair_boarding,
-            'stop_url': self.stop_url
+            'stop_url': self.stop_url,
+            'amenities': amenity_names(self.amenities or 0)
         }
 
 
@@ -71,6 +106,7 @@ class Trip(db.Model):
     """Model for individual GO Transit trips (specific train/bus runs)"""
 
     __tablename__ = 'trips'
+    __bind_key__ = 'transit'
 
     trip_id = db.Column(db.String(50), primary_key=True)
     route_id = db.Column(db.String(50), db.ForeignKey('routes.route_id'), nullable=False)
@@ -89,6 +125,13 @@ class Trip(db.Model):
     stop_times = db.relationship('StopTime', back_populates='trip', lazy='dynamic',
                                  order_by='StopTime.stop_sequence')
 
+    # Covering index for "trips on this route on these service days" (utils/trip_listing.py):
+    # the search columns, then the rest of what to_dict() returns
+    __table_args__ = (
+        db.Index('idx_trip_route_service', 'route_id', 'service_id', 'direction_id', 'trip_id',
+                 'trip_headsign', 'wheelchair_accessible', 'bikes_allowed'),
+    )
+
     def __repr__(self):
         return f'<Trip {self.trip_id} - {self.trip_headsign}>'
 
@@ -109,12 +152,16 @@ class StopTime(db.Model):
     """Model for scheduled stop times (when trips arrive at stops)"""
 
     __tablename__ = 'stop_times'
+    __bind_key__ = 'transit'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     trip_id = db.Column(db.String(50), db.ForeignKey('trips.trip_id'), nullable=False)
     stop_id = db.Column(db.String(50), db.ForeignKey('stops.stop_id'), nullable=False)
-    arrival_time = db.Column(db.Time, nullable=False)
+    arrival_time = db.Column(db.Time, nullable=False)  # time of day (wraps after midnight)
     departure_time = db.Column(db.Time, nullable=False)
+    # Seconds from the start of the service day as in the feed, so 25:10:00 is 90600 rather than 01:10
+    arrival_seconds = db.Column(db.Integer)
+    departure_seconds = db.Column(db.Integer)
     stop_sequence = db.Column(db.Integer, nullable=False)
     pickup_type = db.Column(db.Integer)
     drop_off_type = db.Column(db.Integer)
@@ -142,3 +189,344 @@ class StopTime(db.Model):
             'departure_time': self.departure_time.strftime('%H:%M:%S'),
             'stop_sequence': self.stop_sequence
         }
+
+
+class CalendarDate(db.Model):
+    """Model for dates on which a service runs (calendar_dates.txt)"""
+
+    __tablename__ = 'calendar_dates'
+    __bind_key__ = 'transit'
+
+    service_id = db.Column(db.String(50), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    exception_type = db.Column(db.Integer, nullable=False)  # 1=service added, 2=service removed
+
+    __table_args__ = (
+        db.Index('idx_calendar_date', 'date', 'exception_type', 'service_id'),
+    )
+
+    def __repr__(self):
+        return f'<CalendarDate {self.service_id} {self.date}>'
+
+
+class RouteStats(db.Model):
+    """Service frequency of a route in one direction on one service day, computed by the importer"""
+
+    __tablename__ = 'route_stats'
+    __bind_key__ = 'transit'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    route_id = db.Column(db.String(50), db.ForeignKey('routes.route_id'), nullable=False, index=True)
+    service_id = db.Column(db.String(50), nullable=False)
+    direction_id = db.Column(db.Integer)
+    trip_count = db.Column(db.Integer, nullable=False)
+    # The rest need stop_times.txt; times are minutes from the start of the service day (past 1440 after midnight)
+    first_departure = db.Column(db.Integer)
+    last_departure = db.Column(db.Integer)
+    median_headway = db.Column(db.Float)  # minutes between consecutive departures
+    hourly_trips = db.Column(db.String(120))  # comma-separated departure counts per hour, hour 0 first (24 or more)
+
+    def __repr__(self):
+        return f'<RouteStats {self.route_id} service={self.service_id} direction={self.direction_id}>'
+
+
+# ---------------------------------------------------------------------------
+# Binary transit snapshot
+#
+# A read-only, memory-mapped copy of the transit tables written by the
+# importer next to each feed version. Layout:
+#
+#   8 bytes   magic (SNAPSHOT_MAGIC)
+#   4 bytes   header length (little endian uint32)
+#   N bytes   JSON header: version, tables -> rows/columns -> (kind, offset),
+#             plus the string table offsets
+#   ...       8-byte aligned column blobs
+#
+# Numeric columns are fixed-width arrays ('i' int32, 'd' float64). Times are
+# int32 seconds since midnight. Strings are uint32 ids into a shared, interned
+# string table (uint32 offsets + one UTF-8 blob). Workers mmap the file, so
+# opening it costs only the header parse and pages are shared between them.
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_MAGIC = b'FGSNAP01'
+NULL_INT = -2 ** 31
+NULL_STRING = 0xFFFFFFFF
+
+SNAPSHOT_TYPECODES = {'int': 'i', 'float': 'd', 'time': 'i', 'str': 'I'}
+
+
+def _column_kind(column):
+    """Map a SQLAlchemy column to a snapshot column kind"""
+    if isinstance(column.type, db.Time):
+        return 'time'
+    if isinstance(column.type, db.Float):
+        return 'float'
+    if isinstance(column.type, db.Integer):
+        return 'int'
+    return 'str'
+
+
+def write_snapshot(conn, path, version, models):
+    """Write the given transit models' tables to a snapshot file at path"""
+    strings = {}
+    string_list = []
+
+    def intern(value):
+        if value is None:
+            return NULL_STRING
+        string_id = strings.get(value)
+        if string_id is None:
+            string_id = strings[value] = len(string_list)
+            string_list.append(value)
+        return string_id
+
+    converters = {
+        'int': lambda v: NULL_INT if v is None else v,
+        'float': lambda v: float('nan') if v is None else v,
+        'time': lambda v: NULL_INT if v is None else v.hour * 3600 + v.minute * 60 + v.second,
+        'str': intern,
+    }
+
+    blobs = []
+    tables = {}
+    for model in models:
+        table = model.__table__
+        columns = list(table.columns)
+        kinds = [_column_kind(column) for column in columns]
+        data = [array(SNAPSHOT_TYPECODES[kind]) for kind in kinds]
+
+        rows = conn.execute(select(*columns).order_by(*table.primary_key.columns))
+        count = 0
+        for row in rows:
+            for i, value in enumerate(row):
+                data[i].append(converters[kinds[i]](value))
+            count += 1
+
+        tables[table.name] = {
+            'rows': count,
+            'columns': {column.name: [kind, len(blobs) + i] for i, (column, kind) in enumerate(zip(columns, kinds))}
+        }
+        blobs.extend(data)
+
+    encoded = [value.encode('utf-8') for value in string_list]
+    string_offsets = array('I', [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+    blobs.append(string_offsets)
+    blobs.append(b''.join(encoded))
+
+    # Lay the blobs out after the header, each aligned to 8 bytes
+    def header_bytes(offsets):
+        return json.dumps({
+            'version': version,
+            'tables': tables,
+            'blobs': offsets,
+            'strings': [len(blobs) - 2, len(blobs) - 1],
+        }).encode('utf-8')
+
+    def align(n):
+        return (n + 7) & ~7
+
+    sizes = [len(blob) * blob.itemsize if isinstance(blob, array) else len(blob) for blob in blobs]
+    header_size = len(header_bytes([[10 ** 12, size] for size in sizes]))  # widest possible offsets
+    offsets = []
+    position = align(len(SNAPSHOT_MAGIC) + 4 + header_size)
+    for size in sizes:
+        offsets.append([position, size])
+        position = align(position + size)
+
+    header = header_bytes(offsets).ljust(header_size)
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for blob, (offset, _) in zip(blobs, offsets):
+            f.seek(offset)
+            f.write(blob.tobytes() if isinstance(blob, array) else blob)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SnapshotStrings:
+    """Interned string table of a snapshot"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, string_id):
+        if string_id == NULL_STRING:
+            return None
+        return str(self.data[self.offsets[string_id]:self.offsets[string_id + 1]], 'utf-8')
+
+
+class SnapshotTable:
+    """One table of a snapshot: fixed-width column views plus row helpers"""
+
+    def __init__(self, name, rows, columns, strings):
+        self.name = name
+        self.rows = rows
+        self.columns = columns  # name -> (kind, memoryview)
+        self.strings = strings
+        self._indexes = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """Raw column view (strings are ids, see value())"""
+        return self.columns[name][1]
+
+    def value(self, name, position):
+        """Decoded value of a column at a row position"""
+        kind, view = self.columns[name]
+        value = view[position]
+        if kind == 'str':
+            return self.strings[value]
+        if kind == 'time':
+            return None if value == NULL_INT else time(value // 3600 % 24, value // 60 % 60, value % 60)
+        if kind == 'int':
+            return None if value == NULL_INT else value
+        return None if value != value else value  # NaN marks a missing float
+
+    def row(self, position):
+        """Decoded row as a dict"""
+        return {name: self.value(name, position) for name in self.columns}
+
+    def __iter__(self):
+        for position in range(self.rows):
+            yield self.row(position)
+
+    def index(self, name):
+        """Dict of decoded column value -> row position (built once, on first use)"""
+        if name not in self._indexes:
+            self._indexes[name] = {self.value(name, i): i for i in range(self.rows)}
+        return self._indexes[name]
+
+
+class TransitSnapshot:
+    """Read-only memory-mapped transit snapshot"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError(f'{path} is not a transit snapshot')
+        (header_size,) = struct.unpack_from('<I', buffer, len(SNAPSHOT_MAGIC))
+        start = len(SNAPSHOT_MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start + header_size]))
+
+        blobs = [buffer[offset:offset + size] for offset, size in header['blobs']]
+        offsets_blob, data_blob = header['strings']
+        self.strings = SnapshotStrings(blobs[offsets_blob].cast('I'), blobs[data_blob])
+        self.version = header['version']
+
+        self.tables = {}
+        for name, info in header['tables'].items():
+            columns = {
+                column: (kind, blobs[blob].cast(SNAPSHOT_TYPECODES[kind]))
+                for column, (kind, blob) in info['columns'].items()
+            }
+            self.tables[name] = SnapshotTable(name, info['rows'], columns, self.strings)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __contains__(self, name):
+        return name in self.tables
+
+
+_snapshot = None
+
+
+def get_snapshot():
+    """Get the memory-mapped snapshot of the current feed, or None if there isn't one"""
+    global _snapshot
+    if _snapshot is None:
+        path = feed.current_snapshot_path()
+        if path and os.path.exists(path):
+            _snapshot = TransitSnapshot(path)
+    return _snapshot
+
+
+@feed.on_feed_change
+def release_snapshot():
+    """Forget the mapped snapshot so the new feed's file is mapped on next use"""
+    global _snapshot
+    _snapshot = None
+
+
+def _summarize_frequency(rows):
+    """Frequency summary over RouteStats rows (per service day, for one or all directions)"""
+    trips_by_day = {}
+    hourly_by_day = {}
+    for row in rows:
+        trips_by_day[row.service_id] = trips_by_day.get(row.service_id, 0) + row.trip_count
+        if row.hourly_trips:
+            counts = list(map(int, row.hourly_trips.split(',')))
+            hourly = hourly_by_day.setdefault(row.service_id, [])
+            hourly.extend([0] * (len(counts) - len(hourly)))
+            for hour, count in enumerate(counts):
+                hourly[hour] += count
+
+    firsts = [row.first_departure for row in rows if row.first_departure is not None]
+    lasts = [row.last_departure for row in rows if row.last_departure is not None]
+    headways = [row.median_headway for row in rows if row.median_headway is not None]
+    return {
+        'service_days': len(trips_by_day),
+        'trips_per_day': statistics.median(trips_by_day.values()),
+        'peak_trips_per_hour': max((max(h) for h in hourly_by_day.values()), default=None),
+        # GTFS style: after midnight shows as 24:xx and later
+        'first_departure': format_minutes(min(firsts)) if firsts else None,
+        'last_departure': format_minutes(max(lasts)) if lasts else None,
+        'median_headway_minutes': round(statistics.median(headways), 1) if headways else None
+    }, list(hourly_by_day.values())
+
+
+def summarize_route_stats(rows):
+    """Collapse a route's RouteStats rows into the summary shown on Route.to_dict().
+
+    The top level covers every direction; `directions` has the same figures
+    per direction plus trips_per_hour, the median count for each hour of a
+    service day (hour 0 first; longer than 24 when service runs past midnight).
+    """
+    summary, _ = _summarize_frequency(rows)
+    by_direction = {}
+    for row in rows:
+        by_direction.setdefault(row.direction_id, []).append(row)
+
+    summary['directions'] = []
+    for direction_id in sorted(by_direction, key=lambda d: (d is None, d)):
+        direction, hourly_by_day = _summarize_frequency(by_direction[direction_id])
+        hours = max(map(len, hourly_by_day), default=0)
+        direction['direction_id'] = direction_id
+        direction['trips_per_hour'] = [
+            statistics.median(day[hour] if hour < len(day) else 0 for day in hourly_by_day)
+            for hour in range(hours)
+        ] or None
+        summary['directions'].append(direction)
+    return summary
+
+
+_route_service = None
+
+
+def get_route_service():
+    """route_id -> service frequency summary for the current feed, loaded once per feed"""
+    global _route_service
+    if _route_service is None:
+        rows_by_route = {}
+        for row in db.session.execute(select(RouteStats)).scalars():
+            rows_by_route.setdefault(row.route_id, []).append(row)
+        _route_service = {route_id: summarize_route_stats(rows) for route_id, rows in rows_by_route.items()}
+    return _route_service
+
+
+@feed.on_feed_change
+def release_route_service():
+    """Forget the route service summaries so the new feed's are loaded on next use"""
+    global _route_service
+    _route_service = None
@@ -9,7 +9,7 @@ class UserRoute(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    route_id = db.Column(db.String(50), db.ForeignKey('routes.route_id'), nullable=False)
+    route_id = db.Column(db.String(50), nullable=False)  # routes.route_id in the transit database
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Ensure a user can't add the same route twice
@@ -19,11 +19,17 @@ class UserRoute(db.Model):
 
     # Relationships
     user = db.relationship('User', backref=db.backref('user_routes', lazy='dynamic'))
-    route = db.relationship('Route', backref=db.backref('user_routes', lazy='dynamic'))
+    route = db.relationship('Route', primaryjoin='foreign(UserRoute.route_id) == Route.route_id', viewonly=True)
 
     def __repr__(self):
         return f'<UserRoute user_id={self.user_id} route_id={self.route_id}>'
 
+    @property
+    def route_record(self):
+        """The route from the in-memory transit store (no query, unlike self.route)"""
+        from utils.transit_store import get_transit_store  # utils imports models
+        return get_transit_store().routes_by_id.get(self.route_id)
+
     def to_dict(self):
         """Convert user route object to dictionary"""
         return {
@@ -31,5 +37,5 @@ class UserRoute(db.Model):
             'user_id': self.user_id,
             'route_id': self.route_id,
             'created_at': self.created_at.isoformat(),
-            'route': self.route.to_dict() if self.route else None
+            'route': self.route_record.to_dict() if self.route_record else None
         }
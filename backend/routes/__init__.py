@@ -1,5 +1,5 @@
 """Routes package for FellowGOer API"""
 
-from . import auth, health, routes, chats
+from . import auth, health, routes, chats, stops, commutes, batch, realtime, admin, presence
 
-__all__ = ['auth', 'health', 'routes', 'chats']
+__all__ = ['auth', 'health', 'routes', 'chats', 'stops', 'commutes', 'batch', 'realtime', 'admin', 'presence']
@@ -0,0 +1,108 @@
+import statistics
+from datetime import datetime, timedelta
+from flask import jsonify, request
+from models import db
+from models.job import Job
+from utils.auth import admin_required
+from utils.jobs import HANDLERS, enqueue
+
+MAX_DELAY_SECONDS = 30 * 24 * 3600
+MAX_ATTEMPTS = 20
+
+
+def duration_stats(durations):
+    return {
+        'median_seconds': round(statistics.median(durations), 3),
+        'max_seconds': round(max(durations), 3),
+        'last_seconds': round(durations[-1], 3)
+    } if durations else {}
+
+
+def register_routes(app):
+    """Register operator endpoints (X-Admin-Token)"""
+
+    @app.route('/api/admin/jobs', methods=['GET'])
+    @admin_required
+    def list_jobs():
+        """List recent jobs (?status=, ?name=, ?limit=) and per-job duration stats over ?days= (default 30)"""
+        try:
+            limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+            query = Job.query
+            if request.args.get('status'):
+                query = query.filter(Job.status == request.args['status'])
+            if request.args.get('name'):
+                query = query.filter(Job.name == request.args['name'])
+            jobs = query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit).all()
+
+            # Durations of finished runs, oldest first, so imports can be compared over time
+            since = datetime.utcnow() - timedelta(days=request.args.get('days', 30, type=int))
+            finished = db.session.query(Job.name, Job.status, Job.started_at, Job.finished_at).filter(
+                Job.finished_at >= since, Job.status.in_(('succeeded', 'failed'))
+            ).order_by(Job.finished_at)
+            stats = {}
+            for name, status, started_at, finished_at in finished:
+                entry = stats.setdefault(name, {'succeeded': 0, 'failed': 0, 'durations': []})
+                entry[status] += 1
+                if status == 'succeeded':
+                    entry['durations'].append((finished_at - started_at).total_seconds())
+            stats = {
+                name: {'succeeded': entry['succeeded'], 'failed': entry['failed'], **duration_stats(entry['durations'])}
+                for name, entry in stats.items()
+            }
+
+            return jsonify({
+                'jobs': [job.to_dict() for job in jobs],
+                'stats': stats,
+                'handlers': sorted(HANDLERS)
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/admin/jobs', methods=['POST'])
+    @admin_required
+    def create_job():
+        """Queue a job: {"name": ..., "args": {...}, "delay_seconds": 0, "max_attempts": 3}"""
+        try:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({'error': 'Request body must be a JSON object'}), 400
+            name = data.get('name')
+            if not isinstance(name, str) or name not in HANDLERS:
+                return jsonify({'error': f"name must be one of: {', '.join(sorted(HANDLERS))}"}), 400
+            args = data.get('args') or {}
+            if not isinstance(args, dict):
+                return jsonify({'error': 'args must be an object'}), 400
+
+            delay_seconds = data.get('delay_seconds', 0)
+            if not isinstance(delay_seconds, (int, float)) or isinstance(delay_seconds, bool) \
+                    or not 0 <= delay_seconds <= MAX_DELAY_SECONDS:
+                return jsonify({'error': f'delay_seconds must be a number from 0 to {MAX_DELAY_SECONDS}'}), 400
+            max_attempts = data.get('max_attempts', 3)
+            if not isinstance(max_attempts, int) or isinstance(max_attempts, bool) \
+                    or not 1 <= max_attempts <= MAX_ATTEMPTS:
+                return jsonify({'error': f'max_attempts must be an integer from 1 to {MAX_ATTEMPTS}'}), 400
+
+            job = enqueue(
+                name,
+                args=args,
+                run_at=datetime.utcnow() + timedelta(seconds=delay_seconds),
+                max_attempts=max_attempts
+            )
+            return jsonify({'job': job.to_dict()}), 201
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/admin/jobs/<int:job_id>', methods=['GET'])
+    @admin_required
+    def get_job(job_id):
+        """Get a job's status and progress"""
+        try:
+            job = db.session.get(Job, job_id)
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify({'job': job.to_dict()}), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
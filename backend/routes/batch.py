@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, jsonify, request
+from utils.auth import token_required
+
+BATCH_PATH = '/api/batch'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """Thread pool that runs the read-only sub-requests of a batch concurrently"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+    return _executor
+
+
+def validate_sub_request(sub_request):
+    """Return (method, path, body) for a sub-request. Raises ValueError if it is malformed."""
+    if not isinstance(sub_request, dict):
+        raise ValueError('Each request must be an object')
+
+    method = str(sub_request.get('method', 'GET')).upper()
+    path = sub_request.get('path')
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        raise ValueError(f'Unsupported method: {method}')
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        raise ValueError('path must start with /api/')
+    if path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+        raise ValueError('Batch requests cannot be nested')
+    return method, path, sub_request.get('body')
+
+
+def dispatch(app, user_id, method, path, body):
+    """Run one sub-request through the app's normal request handling"""
+    with app.test_request_context(path, method=method, json=body):
+        g.authenticated_user_id = user_id
+        response = app.full_dispatch_request()
+        data = response.get_json(silent=True)
+        if data is None and response.status_code >= 400:
+            data = {'error': response.status}
+        return {'status': response.status_code, 'body': data}
+
+
+def dispatch_in_thread(app, user_id, method, path, body):
+    """Run a read in a worker thread, with its own app context and session"""
+    with app.app_context():
+        return dispatch(app, user_id, method, path, body)
+
+
+def register_routes(app):
+    """Register the batch endpoint"""
+
+    @app.route(BATCH_PATH, methods=['POST'])
+    @token_required
+    def batch(user_id):
+        """Run several API requests in one round trip.
+
+        Body: {"requests": [{"method": "GET", "path": "/api/routes"}, ...]}
+        Returns {"responses": [{"status": 200, "body": {...}}, ...]} in request order.
+
+        The token is checked once for the whole batch. Consecutive GETs run
+        concurrently; anything else runs alone, in order, on the batch
+        request's own DB session, so later sub-requests see earlier writes.
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            sub_requests = data.get('requests')
+
+            if not isinstance(sub_requests, list) or not sub_requests:
+                return jsonify({'error': 'requests must be a non-empty list'}), 400
+
+            max_requests = current_app.config['BATCH_MAX_REQUESTS']
+            if len(sub_requests) > max_requests:
+                return jsonify({'error': f'At most {max_requests} requests per batch'}), 400
+
+            try:
+                parsed = [validate_sub_request(sub_request) for sub_request in sub_requests]
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            flask_app = current_app._get_current_object()
+            executor = get_executor(current_app.config['BATCH_MAX_WORKERS'])
+            g.authenticated_user_id = user_id
+
+            results = []
+            reads = []
+
+            def run_reads():
+                if len(reads) == 1:
+                    results.append(dispatch(flask_app, user_id, *reads[0]))
+                else:
+                    futures = [executor.submit(dispatch_in_thread, flask_app, user_id, *read)
+                               for read in reads]
+                    results.extend(future.result() for future in futures)
+                reads.clear()
+
+            for method, path, body in parsed:
+                if method == 'GET':
+                    reads.append((method, path, body))
+                    continue
+                if reads:
+                    run_reads()
+                results.append(dispatch(flask_app, user_id, method, path, body))
+            if reads:
+                run_reads()
+
+            return jsonify({'responses': results}), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
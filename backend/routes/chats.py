@@ -3,7 +3,12 @@ from sqlalchemy import and_
 from models import db
 from models.user import User
 from models.chat import Chat, ChatParticipant, Message
+from utils import presence
 from utils.auth import token_required
+from utils.message_archive import iter_chat_messages, page_chat_messages
+from utils.message_writer import get_message_writer
+from utils.message_search import search_messages
+from utils.responses import stream_json
 
 
 def register_routes(app):
@@ -23,9 +28,13 @@ def register_routes(app):
 
             # Get the chats
             chats = Chat.query.filter(Chat.id.in_(chat_ids)).order_by(Chat.updated_at.desc()).all()
+            chats = [chat.to_dict(current_user_id=user_id) for chat in chats]
+
+            # Online flags for every participant in one lookup (other_participant is the same dict)
+            presence.mark_online([participant for chat in chats for participant in chat['participants']])
 
             return jsonify({
-                'chats': [chat.to_dict(current_user_id=user_id) for chat in chats]
+                'chats': chats
             }), 200
 
         except Exception as e:
@@ -93,6 +102,32 @@ def register_routes(app):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/chats/search', methods=['GET'])
+    @token_required
+    def search_chat_messages(user_id):
+        """Full-text search over messages in the current user's chats"""
+        try:
+            query = request.args.get('q', '').strip()
+            if not query:
+                return jsonify({'error': 'q is required'}), 400
+
+            limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+
+            try:
+                results, next_cursor = search_messages(
+                    db.session, user_id, query, limit=limit, cursor=request.args.get('cursor')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify({
+                'results': results,
+                'next_cursor': next_cursor
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/chats/<int:chat_id>', methods=['GET'])
     @token_required
     def get_chat(user_id, chat_id):
@@ -119,7 +154,7 @@ def register_routes(app):
     @app.route('/api/chats/<int:chat_id>/messages', methods=['GET'])
     @token_required
     def get_chat_messages(user_id, chat_id):
-        """Get all messages in a chat"""
+        """Get messages in a chat: all of them, or a page with ?limit= and ?before=<cursor>"""
         try:
             # Check if user is a participant in this chat
             participant = ChatParticipant.query.filter_by(
@@ -130,12 +165,23 @@ def register_routes(app):
             if not participant:
                 return jsonify({'error': 'Chat not found or access denied'}), 404
 
-            # Get messages
-            messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.created_at).all()
+            if 'limit' in request.args or 'before' in request.args:
+                # Paginate backwards from the newest message, through hot and archived messages
+                limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+                try:
+                    messages, next_before = page_chat_messages(
+                        db.session, chat_id, before=request.args.get('before'), limit=limit
+                    )
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
 
-            return jsonify({
-                'messages': [msg.to_dict() for msg in messages]
-            }), 200
+                return jsonify({
+                    'messages': messages,
+                    'next_before': next_before
+                }), 200
+
+            # Stream every message instead of loading them all, archived ones first
+            return stream_json('messages', iter_chat_messages(db.session, chat_id), lambda message: message)
 
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -145,10 +191,13 @@ def register_routes(app):
     def send_message(user_id, chat_id):
         """Send a message in a chat"""
         try:
-            # Check if user is a participant in this chat
-            participant = ChatParticipant.query.filter_by(
-                chat_id=chat_id,
-                user_id=user_id
+            # Check if user is a participant in this chat, fetching their
+            # username for the write-behind response in the same query
+            participant = db.session.query(ChatParticipant.id, User.username).outerjoin(
+                User, User.id == ChatParticipant.user_id
+            ).filter(
+                ChatParticipant.chat_id == chat_id,
+                ChatParticipant.user_id == user_id
             ).first()
 
             if not participant:
@@ -160,6 +209,27 @@ def register_routes(app):
             if not content:
                 return jsonify({'error': 'Message content is required'}), 400
 
+            if app.config['CHAT_WRITE_BEHIND']:
+                # Release this request's connection, then queue the message for the
+                # next group commit and wait for it to be durable
+                db.session.close()
+                try:
+                    pending = get_message_writer(app, db.engine).submit(chat_id, user_id, content).wait(timeout=10)
+                except TimeoutError:
+                    # Withdrawn from the queue, so retrying can't send it twice
+                    return jsonify({'error': 'Message was not sent, please retry'}), 503
+
+                return jsonify({
+                    'message': {
+                        'id': pending.id,
+                        'chat_id': chat_id,
+                        'sender_id': user_id,
+                        'sender_username': participant.username,
+                        'content': content,
+                        'created_at': pending.created_at.isoformat() + 'Z'  # Add Z to indicate UTC
+                    }
+                }), 201
+
             # Create message
             message = Message(
                 chat_id=chat_id,
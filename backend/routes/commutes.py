@@ -0,0 +1,164 @@
+from flask import jsonify, request
+from models import db
+from models.user import User
+from models.commute import Commute, DAY_BITS
+from utils.auth import token_required
+from utils.commute_matching import get_commute_index, bump_commutes_version, commute_added, commute_removed
+from utils.transit_store import get_transit_store
+
+
+def parse_clock(value):
+    """Parse an HH:MM string into minutes since midnight"""
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid time: {value!r}')
+    hours, minutes = value.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Invalid time: {value}')
+    return hours * 60 + minutes
+
+
+def register_routes(app):
+    """Register commute and schedule-level matching endpoints"""
+
+    @app.route('/api/user/commutes', methods=['GET'])
+    @token_required
+    def get_user_commutes(user_id):
+        """Get current user's registered commutes"""
+        try:
+            commutes = Commute.query.filter_by(user_id=user_id).order_by(Commute.depart_after).all()
+            return jsonify({
+                'commutes': [commute.to_dict() for commute in commutes]
+            }), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/user/commutes', methods=['POST'])
+    @token_required
+    def add_user_commute(user_id):
+        """Register a regular commute"""
+        try:
+            data = request.get_json()
+            if not data or not data.get('origin_stop_id') or not data.get('destination_stop_id') \
+                    or not data.get('depart_after') or not data.get('depart_before') or not data.get('days'):
+                return jsonify({'error': 'Missing required fields'}), 400
+
+            try:
+                depart_after = parse_clock(data['depart_after'])
+                depart_before = parse_clock(data['depart_before'])
+            except ValueError:
+                return jsonify({'error': 'Times must be in HH:MM format'}), 400
+
+            if depart_before < depart_after:
+                return jsonify({'error': 'depart_before must not be earlier than depart_after'}), 400
+
+            if not isinstance(data['days'], list):
+                return jsonify({'error': 'days must be a list of day names'}), 400
+
+            days = 0
+            for day in data['days']:
+                if not isinstance(day, str) or day not in DAY_BITS:
+                    return jsonify({'error': f'Unknown day: {day!r}'}), 400
+                days |= DAY_BITS[day]
+
+            origin_stop_id = data['origin_stop_id']
+            destination_stop_id = data['destination_stop_id']
+            if not isinstance(origin_stop_id, str) or not isinstance(destination_stop_id, str):
+                return jsonify({'error': 'Stop ids must be strings'}), 400
+            if origin_stop_id == destination_stop_id:
+                return jsonify({'error': 'Origin and destination must differ'}), 400
+
+            # Check that both stops exist
+            stops = get_transit_store().stops_by_id
+            if origin_stop_id not in stops or destination_stop_id not in stops:
+                return jsonify({'error': 'Stop not found'}), 404
+
+            commute = Commute(
+                user_id=user_id,
+                origin_stop_id=origin_stop_id,
+                destination_stop_id=destination_stop_id,
+                depart_after=depart_after,
+                depart_before=depart_before,
+                days=days
+            )
+            db.session.add(commute)
+            version = bump_commutes_version()
+            db.session.commit()
+            commute_added(commute, version)
+
+            return jsonify({
+                'message': 'Commute added successfully',
+                'commute': commute.to_dict()
+            }), 201
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/user/commutes/<int:commute_id>', methods=['DELETE'])
+    @token_required
+    def delete_user_commute(user_id, commute_id):
+        """Remove a registered commute"""
+        try:
+            commute = Commute.query.filter_by(id=commute_id, user_id=user_id).first()
+
+            if not commute:
+                return jsonify({'error': 'Commute not found'}), 404
+
+            db.session.delete(commute)
+            version = bump_commutes_version()
+            db.session.commit()
+            commute_removed(commute_id, version)
+
+            return jsonify({'message': 'Commute removed successfully'}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/connect/commutes', methods=['GET'])
+    @token_required
+    def get_commute_companions(user_id):
+        """Get users riding the same trips as the current user, ranked by overlapping minutes"""
+        try:
+            commutes = Commute.query.filter_by(user_id=user_id).all()
+            if not commutes:
+                return jsonify({'users': []}), 200
+
+            index = get_commute_index()
+            if index is None:
+                return jsonify({'error': 'Commute matching is starting up, please retry shortly'}), 503, {
+                    'Retry-After': '5'
+                }
+            if not index.schedule.available:
+                return jsonify({
+                    'error': 'Commute matching needs stop times, and the current transit feed has none'
+                }), 503
+
+            matches = index.match(user_id, commutes)
+            if not matches:
+                return jsonify({'users': []}), 200
+
+            users = {
+                user.id: user for user in
+                User.query.filter(User.id.in_([m['user_id'] for m in matches])).all()
+            }
+
+            result = []
+            for match in matches:
+                user = users.get(match['user_id'])
+                if not user:
+                    continue
+                result.append({
+                    'id': user.id,
+                    'username': user.username,
+                    'email': user.email,
+                    'overlap_minutes': match['overlap_minutes'],
+                    'shared_trips_count': match['shared_trips'],
+                    'shared_trip_ids': match['trip_ids']
+                })
+
+            return jsonify({'users': result}), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
@@ -0,0 +1,78 @@
+from flask import jsonify, request
+from models.chat import ChatParticipant
+from utils import presence
+from utils.auth import token_required
+
+
+def register_routes(app):
+    """Register presence and typing indicator endpoints (in memory, see utils/presence.py)"""
+
+    @app.route('/api/presence/heartbeat', methods=['POST'])
+    @token_required
+    def heartbeat(user_id):
+        """Keep the current user online; token_required has already recorded the activity"""
+        return jsonify({'online': True, 'ttl': app.config['PRESENCE_TTL_SECONDS']}), 200
+
+    @app.route('/api/presence', methods=['GET'])
+    @token_required
+    def get_presence(user_id):
+        """Get online flags for up to 500 users (?user_ids=1,2,3)"""
+        try:
+            try:
+                user_ids = [int(value) for value in request.args.get('user_ids', '').split(',') if value.strip()]
+            except ValueError:
+                return jsonify({'error': 'user_ids must be a comma-separated list of ids'}), 400
+            if len(user_ids) > 500:
+                return jsonify({'error': 'At most 500 user_ids per request'}), 400
+
+            return jsonify({
+                'users': presence.mark_online([{'user_id': uid} for uid in dict.fromkeys(user_ids)])
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/chats/<int:chat_id>/typing', methods=['POST'])
+    @token_required
+    def set_typing(user_id, chat_id):
+        """Start ({"typing": true}, repeat every few seconds while typing) or stop typing in a chat"""
+        try:
+            # Check if user is a participant in this chat
+            participant = ChatParticipant.query.filter_by(
+                chat_id=chat_id,
+                user_id=user_id
+            ).first()
+
+            if not participant:
+                return jsonify({'error': 'Chat not found or access denied'}), 404
+
+            data = request.get_json(silent=True) or {}
+            if data.get('typing', True):
+                presence.typing.start(chat_id, user_id)
+            else:
+                presence.typing.stop(chat_id, user_id)
+
+            return jsonify({'ttl': app.config['TYPING_TTL_SECONDS']}), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/chats/<int:chat_id>/typing', methods=['GET'])
+    @token_required
+    def get_typing(user_id, chat_id):
+        """Get the other participants currently typing in a chat"""
+        try:
+            participant = ChatParticipant.query.filter_by(
+                chat_id=chat_id,
+                user_id=user_id
+            ).first()
+
+            if not participant:
+                return jsonify({'error': 'Chat not found or access denied'}), 404
+
+            return jsonify({
+                'typing': [uid for uid in presence.typing.in_chat(chat_id) if uid != user_id]
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
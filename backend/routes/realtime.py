@@ -0,0 +1,93 @@
+import time
+from datetime import datetime, timezone
+from flask import jsonify, request
+from utils.auth import token_required
+from utils.realtime import get_static_trips, store
+from utils.transit_store import get_transit_store
+
+# Departures that left up to this long ago are still shown, as "just left"
+DEPARTED_GRACE_SECONDS = 60
+
+
+def utc_isoformat(timestamp):
+    """ISO 8601 UTC time of an epoch timestamp, with the Z suffix used across the API"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat() + 'Z'
+
+
+def register_routes(app):
+    """Register GTFS-realtime endpoints (served from memory, see utils/realtime.py)"""
+
+    @app.route('/api/trips/<trip_id>/realtime', methods=['GET'])
+    @token_required
+    def get_trip_realtime(user_id, trip_id):
+        """Get the latest delay, stop predictions and vehicle position of a trip"""
+        try:
+            realtime = store.trip_state(trip_id)
+            if realtime is None and trip_id not in get_static_trips():
+                return jsonify({'error': 'Trip not found'}), 404
+
+            return jsonify({
+                'trip_id': trip_id,
+                'realtime': realtime,
+                'version': store.version_token()
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/stops/<stop_id>/departures', methods=['GET'])
+    @token_required
+    def get_stop_departures(user_id, stop_id):
+        """Get the next predicted departures from a stop (?limit=, default 20)"""
+        try:
+            if stop_id not in get_transit_store().stops_by_id:
+                return jsonify({'error': 'Stop not found'}), 404
+
+            limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+            routes_by_id = get_transit_store().routes_by_id
+            static_trips = get_static_trips()
+
+            departures = []
+            for when, trip_id, stop_time_update in store.departures(stop_id, time.time() - DEPARTED_GRACE_SECONDS)[:limit]:
+                update = store.updates.get(trip_id)
+                route_id, headsign = static_trips.get(trip_id, (update.route_id if update else None, None))
+                route = routes_by_id.get(route_id)
+                departures.append({
+                    'trip_id': trip_id,
+                    'route_id': route_id,
+                    'route_short_name': route.route_short_name if route else None,
+                    'trip_headsign': headsign,
+                    'time': utc_isoformat(when),
+                    'delay': stop_time_update.departure_delay if stop_time_update.departure_delay is not None
+                    else stop_time_update.arrival_delay,
+                    'schedule_relationship': stop_time_update.schedule_relationship,
+                    'trip_schedule_relationship': update.schedule_relationship if update else None
+                })
+
+            return jsonify({
+                'stop_id': stop_id,
+                'departures': departures,
+                'version': store.version_token()
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/realtime/changes', methods=['GET'])
+    @token_required
+    def get_realtime_changes(user_id):
+        """Get the trips whose realtime state changed after ?since=<version token> (null = no longer
+        reported). With full=true (no token, a token from another worker or run, or one too far
+        behind) the client gets every reported trip and should replace its state."""
+        try:
+            version, changes, full = store.changes_since(request.args.get('since'))
+
+            return jsonify({
+                'version': version,
+                'full': full,
+                'trips': changes,
+                'updated_at': utc_isoformat(store.updated_at) if store.updated_at else None
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
@@ -1,10 +1,17 @@
+from datetime import date, datetime
 from flask import jsonify, request
-from sqlalchemy import and_, func
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
 from models import db
 from models.user import User
-from models.transit import Route
 from models.user_route import UserRoute
+from utils import presence
 from utils.auth import token_required
+from utils.responses import cached_json, stream_json
+from utils.route_matching import get_route_match_index, bump_user_routes_version, user_routes_changed
+from utils.transit_store import get_transit_store
+from utils.trip_listing import get_route_trips
+from utils.realtime import store as realtime_store
 
 
 def register_routes(app):
@@ -15,10 +22,43 @@ def register_routes(app):
     def get_all_routes(user_id):
         """Get all available GO Transit routes"""
         try:
-            routes = Route.query.order_by(Route.route_short_name).all()
+            # Routes only change with the transit feed, so serve a cached (pre-compressed) payload
+            return cached_json('routes', lambda: {
+                'routes': [route.to_dict() for route in get_transit_store().routes]
+            })
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/routes/<route_id>/trips', methods=['GET'])
+    @token_required
+    def get_route_trips_on_day(user_id, route_id):
+        """Get a route's trips on a day (?date=YYYY-MM-DD, default today), optionally
+        in one direction (?direction=0|1), paginated with ?after=<trip_id>&limit="""
+        try:
+            if route_id not in get_transit_store().routes_by_id:
+                return jsonify({'error': 'Route not found'}), 404
+
+            try:
+                day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() \
+                    if request.args.get('date') else date.today()
+            except ValueError:
+                return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+
+            direction = request.args.get('direction')
+            if direction not in (None, '0', '1'):
+                return jsonify({'error': 'direction must be 0 or 1'}), 400
+
+            limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+            trips, next_after = get_route_trips(
+                route_id, day, int(direction) if direction is not None else None
+            ).page(after=request.args.get('after'), limit=limit)
+
             return jsonify({
-                'routes': [route.to_dict() for route in routes]
+                'date': day.isoformat(),
+                'trips': [{**trip, 'realtime': realtime_store.trip_state(trip['trip_id'])} for trip in trips],
+                'next_after': next_after
             }), 200
+
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -46,8 +86,7 @@ def register_routes(app):
                 return jsonify({'error': 'route_id is required'}), 400
 
             # Check if route exists
-            route = Route.query.get(route_id)
-            if not route:
+            if route_id not in get_transit_store().routes_by_id:
                 return jsonify({'error': 'Route not found'}), 404
 
             # Check if user already has this route
@@ -62,7 +101,9 @@ def register_routes(app):
             # Add the route
             user_route = UserRoute(user_id=user_id, route_id=route_id)
             db.session.add(user_route)
+            version = bump_user_routes_version()
             db.session.commit()
+            user_routes_changed(user_id, version, added=[route_id])
 
             return jsonify({
                 'message': 'Route added successfully',
@@ -73,6 +114,56 @@ def register_routes(app):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/user/routes', methods=['PUT'])
+    @token_required
+    def set_user_routes(user_id):
+        """Replace the user's selection with the given set of routes"""
+        try:
+            data = request.get_json(silent=True) or {}
+            route_ids = data.get('route_ids')
+
+            if not isinstance(route_ids, list) or not all(isinstance(r, str) for r in route_ids):
+                return jsonify({'error': 'route_ids must be a list of route ids'}), 400
+
+            wanted = set(route_ids)
+            unknown = sorted(wanted - get_transit_store().routes_by_id.keys())
+            if unknown:
+                return jsonify({'error': 'Route not found', 'route_ids': unknown}), 404
+
+            current = {row[0] for row in db.session.query(UserRoute.route_id).filter_by(user_id=user_id)}
+            added = sorted(wanted - current)
+            removed = sorted(current - wanted)
+
+            # Apply the difference as one bulk insert and one bulk delete, in one transaction
+            if added:
+                now = datetime.utcnow()
+                db.session.execute(insert(UserRoute), [
+                    {'user_id': user_id, 'route_id': route_id, 'created_at': now} for route_id in added
+                ])
+            if removed:
+                db.session.execute(delete(UserRoute).where(
+                    UserRoute.user_id == user_id, UserRoute.route_id.in_(removed)
+                ))
+            if added or removed:
+                version = bump_user_routes_version()
+                db.session.commit()
+                user_routes_changed(user_id, version, added=added, removed=removed)
+
+            user_routes = UserRoute.query.filter_by(user_id=user_id).all()
+            return jsonify({
+                'routes': [ur.to_dict() for ur in user_routes],
+                'added': added,
+                'removed': removed
+            }), 200
+
+        except IntegrityError:
+            # A concurrent request changed the selection first
+            db.session.rollback()
+            return jsonify({'error': 'Routes changed concurrently, please retry'}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/user/routes/<int:user_route_id>', methods=['DELETE'])
     @token_required
     def delete_user_route(user_id, user_route_id):
@@ -87,7 +178,9 @@ def register_routes(app):
                 return jsonify({'error': 'Route not found'}), 404
 
             db.session.delete(user_route)
+            version = bump_user_routes_version()
             db.session.commit()
+            user_routes_changed(user_id, version, removed=[user_route.route_id])
 
             return jsonify({'message': 'Route removed successfully'}), 200
 
@@ -100,52 +193,36 @@ def register_routes(app):
     def get_matching_users(user_id):
         """Get users who share at least one route with the current user"""
         try:
-            # Get the current user's route IDs
-            user_route_ids = db.session.query(UserRoute.route_id).filter_by(user_id=user_id).all()
-            user_route_ids = [r[0] for r in user_route_ids]
+            # Other users sharing a route, from the in-memory index
+            shared_route_ids = get_route_match_index().match(user_id)
 
-            if not user_route_ids:
+            if not shared_route_ids:
                 return jsonify({'users': []}), 200
 
-            # Find other users who have at least one matching route
-            matching_users = db.session.query(
-                User.id,
-                User.username,
-                User.email,
-                func.count(UserRoute.route_id).label('shared_routes_count')
-            ).join(
-                UserRoute, UserRoute.user_id == User.id
-            ).filter(
-                and_(
-                    User.id != user_id,  # Exclude current user
-                    UserRoute.route_id.in_(user_route_ids)  # Match routes
-                )
-            ).group_by(
-                User.id, User.username, User.email
-            ).all()
-
-            # Get detailed information for each matching user
-            result = []
-            for match in matching_users:
-                # Get the shared routes
-                shared_routes = db.session.query(Route).join(
-                    UserRoute, UserRoute.route_id == Route.route_id
-                ).filter(
-                    and_(
-                        UserRoute.user_id == match.id,
-                        UserRoute.route_id.in_(user_route_ids)
-                    )
-                ).all()
-
-                result.append({
-                    'id': match.id,
-                    'username': match.username,
-                    'email': match.email,
-                    'shared_routes_count': match.shared_routes_count,
-                    'shared_routes': [route.to_dict() for route in shared_routes]
-                })
-
-            return jsonify({'users': result}), 200
+            routes = get_transit_store().routes_by_id
+            user_route_ids = {route_id for route_ids in shared_route_ids.values() for route_id in route_ids}
+            routes_by_id = {route_id: routes[route_id].to_dict() for route_id in user_route_ids if route_id in routes}
+
+            def matches():
+                """Yield matching users, fetching their details one chunk at a time"""
+                match_ids = sorted(shared_route_ids)
+                for offset in range(0, len(match_ids), 500):
+                    users = db.session.query(User.id, User.username, User.email).filter(
+                        User.id.in_(match_ids[offset:offset + 500])
+                    ).order_by(User.id)
+
+                    chunk = [{
+                        'id': match.id,
+                        'username': match.username,
+                        'email': match.email,
+                        'shared_routes_count': len(shared_route_ids[match.id]),
+                        'shared_routes': [routes_by_id[route_id]
+                                          for route_id in shared_route_ids[match.id]
+                                          if route_id in routes_by_id]
+                    } for match in users]
+                    yield from presence.mark_online(chunk, key='id')
+
+            return stream_json('users', matches(), lambda user: user)
 
         except Exception as e:
             return jsonify({'error': str(e)}), 500
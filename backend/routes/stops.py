@@ -0,0 +1,38 @@
+from flask import jsonify, request
+from utils.auth import token_required
+from utils.amenities import get_amenity_index, parse_amenities
+from utils.transit_store import get_transit_store
+
+
+def register_routes(app):
+    """Register stop lookup endpoints"""
+
+    @app.route('/api/stops', methods=['GET'])
+    @token_required
+    def get_stops(user_id):
+        """Get stops, optionally filtered by name (?q=) and amenities (?has=washroom,shelter)"""
+        try:
+            try:
+                required = parse_amenities(request.args.get('has'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            search = request.args.get('q', '').strip().lower()
+            index = get_amenity_index()
+            stops = get_transit_store().stops  # sorted by name
+
+            if search:
+                # Name search first, then narrow the results with the amenity index
+                stops = [stop for stop in stops if search in stop.stop_name.lower()]
+                allowed = set(index.filter([stop.stop_id for stop in stops], required))
+                stops = [stop for stop in stops if stop.stop_id in allowed]
+            elif required:
+                allowed = set(index.stop_ids_for(index.matching(required)))
+                stops = [stop for stop in stops if stop.stop_id in allowed]
+
+            return jsonify({
+                'stops': [stop.to_dict() for stop in stops]
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
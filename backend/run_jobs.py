@@ -0,0 +1,47 @@
+"""
+Run background jobs as a sidecar process (instead of JOBS_IN_PROCESS=1 in
+the web workers), or queue one:
+
+    python run_jobs.py                       # work the queue and run JOB_SCHEDULE
+    python run_jobs.py enqueue <job> [json]  # e.g. enqueue import_feed, enqueue archive_messages '{"days": 30}'
+
+Several sidecars (or a sidecar plus in-process runners) can share the jobs
+table; see utils/jobs.py.
+"""
+
+import json
+import os
+import sys
+import time
+
+# Scripts don't serve requests, so they have no caches to refresh (see PROCESS_REFRESH)
+os.environ.setdefault('PROCESS_REFRESH', '0')
+
+from app import app  # noqa: E402
+from utils.jobs import HANDLERS, enqueue  # noqa: E402
+
+
+def main():
+    runner = app.extensions['job_runner']
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'enqueue':
+        if len(sys.argv) < 3 or sys.argv[2] not in HANDLERS:
+            print(f"Usage: python run_jobs.py enqueue <{'|'.join(sorted(HANDLERS))}> [json args]")
+            sys.exit(1)
+        with app.app_context():
+            job = enqueue(sys.argv[2], args=json.loads(sys.argv[3]) if len(sys.argv) > 3 else None)
+            print(f"Queued {job.name} as job {job.id}")
+        return
+
+    print(f"Running jobs with {runner.workers} workers; schedule: "
+          f"{'; '.join(f'{cron.expression} {name}' for cron, name in runner.schedule) or 'none'}")
+    runner.threads.ensure_started()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
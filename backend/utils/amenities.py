@@ -0,0 +1,100 @@
+"""In-memory stop amenity index for fast amenity filtering"""
+
+from array import array
+from models.transit import Stop, AMENITY_BITS
+from utils.feed import on_feed_change
+
+
+class StopAmenityIndex:
+    """Amenity bitmasks for every stop, with one column bitset per amenity.
+
+    Each amenity is stored as a Python int used as a bitset over stop
+    positions, so a filter like "washroom AND shelter" is a single bitwise
+    AND across all stops instead of a per-row check or SQL OR chain.
+    """
+
+    def __init__(self, stop_ids, masks):
+        self.stop_ids = list(stop_ids)
+        self.masks = array('B', masks)
+        self.positions = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.all_stops = (1 << len(self.stop_ids)) - 1
+
+        # Build the column bitsets
+        self.columns = {}
+        for bit in AMENITY_BITS.values():
+            column = 0
+            for i, mask in enumerate(self.masks):
+                if mask & bit:
+                    column |= 1 << i
+            self.columns[bit] = column
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def matching(self, required):
+        """Return a bitset of stop positions that have every required amenity"""
+        result = self.all_stops
+        for bit, column in self.columns.items():
+            if required & bit:
+                result &= column
+        return result
+
+    def bitset_for(self, stop_ids):
+        """Convert a list of stop ids (e.g. search results) into a bitset"""
+        result = 0
+        for stop_id in stop_ids:
+            position = self.positions.get(stop_id)
+            if position is not None:
+                result |= 1 << position
+        return result
+
+    def stop_ids_for(self, bitset):
+        """Expand a bitset back into stop ids, in index order"""
+        result = []
+        while bitset:
+            low_bit = bitset & -bitset
+            result.append(self.stop_ids[low_bit.bit_length() - 1])
+            bitset ^= low_bit
+        return result
+
+    def filter(self, stop_ids, required):
+        """Keep only the given stop ids that have every required amenity, preserving order"""
+        if not required:
+            return list(stop_ids)
+        matches = set(self.stop_ids_for(self.matching(required) & self.bitset_for(stop_ids)))
+        return [stop_id for stop_id in stop_ids if stop_id in matches]
+
+
+def parse_amenities(value):
+    """Parse a comma separated amenity list (e.g. "washroom,shelter") into a bitmask.
+
+    Raises ValueError for unknown amenity names.
+    """
+    required = 0
+    for name in (value or '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in AMENITY_BITS:
+            raise ValueError(f'Unknown amenity: {name}')
+        required |= AMENITY_BITS[name]
+    return required
+
+
+_index = None
+
+
+def get_amenity_index():
+    """Get the process-wide amenity index, loading it on first use"""
+    global _index
+    if _index is None:
+        rows = Stop.query.with_entities(Stop.stop_id, Stop.amenities).order_by(Stop.stop_id).all()
+        _index = StopAmenityIndex([r.stop_id for r in rows], [r.amenities or 0 for r in rows])
+    return _index
+
+
+@on_feed_change
+def invalidate_amenity_index():
+    """Drop the cached index so it is rebuilt on next use (e.g. after an import)"""
+    global _index
+    _index = None
@@ -1,10 +1,12 @@
 """Authentication utilities for token and password management"""
 
+import hmac
 import jwt
 import bcrypt
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import current_app, g, request, jsonify
+from utils import presence
 
 
 def hash_password(password):
@@ -42,6 +44,10 @@ def token_required(f):
     """Decorator to protect routes that require authentication"""
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Sub-requests of /api/batch reuse the batch request's authentication
+        if g.get('authenticated_user_id') is not None:
+            return f(user_id=g.authenticated_user_id, *args, **kwargs)
+
         token = None
 
         # Get token from Authorization header
@@ -56,7 +62,6 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
 
         # Get secret key from app config
-        from flask import current_app
         secret_key = current_app.config['SECRET_KEY']
 
         # Decode token
@@ -64,7 +69,22 @@ def token_required(f):
         if not payload:
             return jsonify({'error': 'Token is invalid or expired'}), 401
 
+        # Any authenticated request counts as activity (in memory only, see utils/presence.py)
+        presence.seen(payload['user_id'])
+
         # Pass user_id to the route
         return f(user_id=payload['user_id'], *args, **kwargs)
 
     return decorated
+
+
+def admin_required(f):
+    """Decorator for operator endpoints: requires an X-Admin-Token header matching ADMIN_TOKEN"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        admin_token = current_app.config.get('ADMIN_TOKEN')
+        if not admin_token or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+            return jsonify({'error': 'Admin token required'}), 403
+        return f(*args, **kwargs)
+
+    return decorated
@@ -0,0 +1,39 @@
+"""Background threads started lazily in each process.
+
+Threads don't survive a fork, so threads started when the app is imported
+(e.g. in a gunicorn master with --preload) would be missing from every
+worker. ProcessThreads starts its threads on first use in each process
+instead, and again in a forked child.
+"""
+
+import os
+import threading
+
+
+class ProcessThreads:
+    """Daemon threads started the first time ensure_started() is called in each process"""
+
+    def __init__(self, targets, on_start=None):
+        self.targets = list(targets)  # [(thread name, function), ...]
+        self.on_start = on_start  # resets per-process state before the threads start
+        self.threads = []
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid != os.getpid():
+                if self.on_start is not None:
+                    self.on_start()
+                self.threads = [threading.Thread(target=target, name=name, daemon=True)
+                                for name, target in self.targets]
+                for thread in self.threads:
+                    thread.start()
+                self.pid = os.getpid()
+
+    def start_in_each_process(self):
+        """Start now, and in every child forked from this process (e.g. preloaded gunicorn workers)"""
+        self.ensure_started()
+        os.register_at_fork(after_in_child=self.ensure_started)
@@ -0,0 +1,327 @@
+"""Schedule-level commute matching.
+
+Commutes are resolved to the specific trips they ride using a schedule
+interval index (sorted departure arrays per stop, searched with bisect),
+then indexed by trip so finding companions for a user is a handful of
+dict lookups rather than a query per commute.
+
+Resolving commutes to trips needs stop times. Feeds published without
+stop_times.txt (the bundled GO Transit extract has none) give an empty
+schedule; ScheduleIndex.available is False then, and the companion
+endpoint reports that instead of returning no matches.
+
+Riders only share a trip on the weekdays it runs: each trip's service_id
+is resolved to a weekday mask from calendar_dates, and a commute is
+indexed against a trip with the days both have in common.
+
+Stop times are kept as GTFS has them, in minutes from the start of the
+trip's service day, so a 25:10 departure is 1510 rather than 01:10. Stops
+are searched by clock time (what a commute's window is in), and a stop
+reached after midnight is boarded the calendar day after the service
+day, which is what its weekdays are shifted by before comparing them
+with the commute's.
+
+Building the index takes seconds per 100k commutes, so it is built in a
+background thread, started by each worker's first request. Until the
+first build finishes get_commute_index() returns None; afterwards a stale
+index keeps answering while its replacement is built.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from flask import current_app
+from models import db
+from models.commute import Commute, ALL_DAYS, DAY_NAMES
+from models.transit import StopTime, Trip, CalendarDate
+from utils.data_version import data_version, bump_data_version
+from utils.feed import on_feed_change
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(value):
+    """Convert a datetime.time into minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+
+def service_minutes(seconds, value):
+    """Minutes from the start of the service day, from the import's unwrapped seconds.
+
+    Databases imported before those were stored only have the time of day.
+    """
+    return seconds // 60 if seconds is not None else to_minutes(value)
+
+
+def shift_days(days, shift):
+    """Move a weekday mask `shift` days later (negative for earlier), wrapping Sunday to Monday"""
+    shift %= len(DAY_NAMES)
+    return ((days << shift) | (days >> (len(DAY_NAMES) - shift))) & ALL_DAYS
+
+
+def service_day_masks():
+    """Map each service_id to the weekdays (Commute.days bits) it runs, from calendar_dates"""
+    masks = defaultdict(int)
+    rows = db.session.query(CalendarDate.service_id, CalendarDate.date).filter(CalendarDate.exception_type == 1)
+    for service_id, date in rows:
+        masks[service_id] |= 1 << date.weekday()
+    return masks
+
+
+class ScheduleIndex:
+    """Departure times per stop (sorted), each trip's stop sequence, and the weekdays it runs.
+
+    stop_time_rows carry service-day minutes, which pass 1440 after midnight.
+    stop_departures holds the clock minute for bisecting; stop_trips keeps
+    the service-day minute alongside each trip.
+    """
+
+    def __init__(self, stop_time_rows, trip_days=None):
+        departures = defaultdict(list)
+        self.trip_stops = defaultdict(dict)
+        self.trip_days = trip_days or {}
+
+        for trip_id, stop_id, arrival, departure, sequence in stop_time_rows:
+            departures[stop_id].append((departure % MINUTES_PER_DAY, departure, trip_id, sequence))
+            self.trip_stops[trip_id][stop_id] = (sequence, arrival)
+
+        self.stop_departures = {}
+        self.stop_trips = {}
+        for stop_id, rows in departures.items():
+            rows.sort()
+            self.stop_departures[stop_id] = array('H', [row[0] for row in rows])
+            self.stop_trips[stop_id] = [(row[2], row[3], row[1]) for row in rows]
+
+    @property
+    def available(self):
+        """Whether the feed had stop times to match commutes against"""
+        return bool(self.stop_departures)
+
+    def days(self, trip_id):
+        """Weekdays the trip runs on"""
+        # Services only defined in calendar.txt (not imported) have no calendar_dates rows
+        return self.trip_days.get(trip_id, ALL_DAYS)
+
+    @classmethod
+    def load(cls):
+        """Build the index from the stop_times, trips and calendar_dates tables"""
+        masks = service_day_masks()
+        trip_days = {
+            trip_id: masks[service_id]
+            for trip_id, service_id in db.session.query(Trip.trip_id, Trip.service_id)
+            if service_id in masks
+        }
+        rows = db.session.query(
+            StopTime.trip_id, StopTime.stop_id, StopTime.arrival_seconds, StopTime.arrival_time,
+            StopTime.departure_seconds, StopTime.departure_time, StopTime.stop_sequence
+        ).yield_per(10000)
+        return cls((
+            (trip_id, stop_id, service_minutes(arrival_seconds, arrival),
+             service_minutes(departure_seconds, departure), sequence)
+            for trip_id, stop_id, arrival_seconds, arrival, departure_seconds, departure, sequence in rows
+        ), trip_days)
+
+    def trips_between(self, origin_stop_id, destination_stop_id, depart_after, depart_before):
+        """Find trips leaving origin within the window (clock minutes) that later reach destination.
+
+        Returns a list of (trip_id, board_minutes, alight_minutes) in
+        service-day minutes; board_minutes // MINUTES_PER_DAY is how many
+        days after its service day the trip reaches the origin.
+        """
+        times = self.stop_departures.get(origin_stop_id)
+        if times is None:
+            return []
+
+        start = bisect_left(times, depart_after)
+        end = bisect_right(times, depart_before)
+        trips = self.stop_trips[origin_stop_id]
+
+        result = []
+        for i in range(start, end):
+            trip_id, origin_sequence, board = trips[i]
+            stop = self.trip_stops[trip_id].get(destination_stop_id)
+            if stop is None or stop[0] <= origin_sequence:
+                continue
+            result.append((trip_id, board, stop[1]))
+        return result
+
+
+class CommuteIndex:
+    """Riders per trip, built from every registered commute.
+
+    Requests add, remove and match concurrently (e.g. on the ASGI mode's
+    thread pool), so the rider maps are only touched under the lock.
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        # trip_id -> {commute_id: (user_id, service days, board, alight)}, times in service-day minutes
+        self.riders = defaultdict(dict)
+        self.commute_trips = {}          # commute_id -> [trip_id, ...]
+        self.version = None              # commutes data version the index reflects
+        self._lock = threading.Lock()
+
+    def add(self, commute):
+        """Resolve a commute to the trips it can ride on its days, and index it.
+
+        Riders are stored with the trip's service days they ride on, so
+        riders boarding before and after midnight compare on the same days.
+        """
+        trips = self.schedule.trips_between(
+            commute.origin_stop_id, commute.destination_stop_id,
+            commute.depart_after, commute.depart_before
+        )
+        entries = []
+        for trip_id, board, alight in trips:
+            # The commute's weekdays moved back to the service days the trip started on
+            days = shift_days(commute.days, -(board // MINUTES_PER_DAY)) & self.schedule.days(trip_id)
+            if days:
+                entries.append((trip_id, (commute.user_id, days, board, alight)))
+        with self._lock:
+            for trip_id, entry in entries:
+                self.riders[trip_id][commute.id] = entry
+            self.commute_trips[commute.id] = [trip_id for trip_id, _ in entries]
+
+    def remove(self, commute_id):
+        """Remove a commute from the index"""
+        with self._lock:
+            for trip_id in self.commute_trips.pop(commute_id, []):
+                riders = self.riders.get(trip_id)
+                if riders is not None:
+                    riders.pop(commute_id, None)
+                    if not riders:
+                        del self.riders[trip_id]
+
+    def match(self, user_id, commutes):
+        """Rank other users by overlapping minutes on shared trips.
+
+        A trip only counts when it runs on a day both riders commute
+        (riders are indexed with their days already narrowed to the
+        trip's). Returns a list of dicts with user_id, overlap_minutes, shared_trips
+        and trip_ids, best match first.
+        """
+        overlap = defaultdict(int)
+        shared = defaultdict(set)
+
+        with self._lock:
+            for commute in commutes:
+                for trip_id in self.commute_trips.get(commute.id, []):
+                    riders = self.riders[trip_id]
+                    _, days, board, alight = riders[commute.id]
+                    for other_user, other_days, other_board, other_alight in riders.values():
+                        if other_user == user_id or not (days & other_days):
+                            continue
+                        minutes = min(alight, other_alight) - max(board, other_board)
+                        if minutes <= 0:
+                            continue
+                        overlap[other_user] += minutes
+                        shared[other_user].add(trip_id)
+
+        ranked = sorted(overlap.items(), key=lambda item: (-item[1], item[0]))
+        return [{
+            'user_id': other_user,
+            'overlap_minutes': minutes,
+            'shared_trips': len(shared[other_user]),
+            'trip_ids': sorted(shared[other_user])
+        } for other_user, minutes in ranked]
+
+
+def bump_commutes_version():
+    """Record a write to commutes; call before committing it"""
+    return bump_data_version(Commute.__tablename__)
+
+
+_schedule = None
+_index = None
+_builder = None  # thread building a fresh index
+_builder_lock = threading.Lock()
+
+
+def build_commute_index():
+    """Build the commute index from the database (seconds per 100k commutes)"""
+    global _schedule
+    schedule = _schedule
+    if schedule is None:
+        schedule = _schedule = ScheduleIndex.load()
+
+    # Read the version first: rows written meanwhile only make the index look older than it is
+    version = data_version(Commute.__tablename__)
+    index = CommuteIndex(schedule)
+    rows = db.session.query(
+        Commute.id, Commute.user_id, Commute.origin_stop_id, Commute.destination_stop_id,
+        Commute.depart_after, Commute.depart_before, Commute.days
+    ).yield_per(10000)
+    for commute in rows:
+        index.add(commute)
+    index.version = version
+    return index
+
+
+def _build_in_background(app):
+    global _index
+    with app.app_context():
+        try:
+            index = build_commute_index()
+        except Exception as e:
+            print(f"[commutes] building the commute index failed: {e}")
+            return
+    if index.schedule is _schedule:  # not built against a feed that has since been replaced
+        _index = index
+
+
+def refresh_commute_index():
+    """Start building a fresh index in a background thread, unless one is already being built"""
+    global _builder
+    with _builder_lock:
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_build_in_background, args=(current_app._get_current_object(),),
+                                        name='commute-index', daemon=True)
+            _builder.start()
+        return _builder
+
+
+def get_commute_index(wait=False):
+    """Get the process-wide commute index, or None while the first build is running.
+
+    When commutes changed in another worker a rebuild is started and the
+    current index is returned meanwhile. wait=True blocks until the index
+    is current instead.
+    """
+    if _index is None or _index.version != data_version(Commute.__tablename__):
+        builder = refresh_commute_index()
+        if wait:
+            builder.join()
+    return _index
+
+
+def commute_added(commute, version):
+    """Apply a newly committed commute (bumped to `version`) to the index in place"""
+    # Otherwise another worker changed commutes too, and get_commute_index() rebuilds
+    if _index is not None and _index.version == version - 1:
+        _index.add(commute)
+        _index.version = version
+
+
+def commute_removed(commute_id, version):
+    """Drop a deleted commute (bumped to `version`) from the index in place"""
+    if _index is not None and _index.version == version - 1:
+        _index.remove(commute_id)
+        _index.version = version
+
+
+@on_feed_change
+def invalidate_commute_index():
+    """Drop the schedule and commute indexes (e.g. after an import)"""
+    global _schedule, _index
+    _schedule = None
+    _index = None
+
+
+def init_commute_matching(app):
+    """Start building the commute index when each worker serves its first request"""
+
+    @app.before_request
+    def start_commute_index():
+        if _builder is None:
+            refresh_commute_index()
@@ -0,0 +1,38 @@
+"""Change counters for in-memory state kept by every worker.
+
+Most count writes to a table, named after it; others count events, e.g.
+the rebuild_indexes job (see utils/job_handlers.py).
+
+A write bumps its table's counter inside the same transaction, so the
+counter moves exactly when the rows do, in whichever process made the
+change. An index built at version N is current while the counter reads N;
+a write that bumped the counter to N + 1 can be applied in place, and any
+other value means some other worker wrote too and the index is rebuilt.
+
+Row ids can't stand in for this: SQLite reuses the highest rowid after a
+delete, so a (count, max id) fingerprint misses a delete followed by an
+insert.
+"""
+
+from sqlalchemy import select, update
+from models import db
+from models.data_version import DataVersion
+
+
+def data_version(name):
+    """Current counter for `name` (0 before the first write)"""
+    return db.session.scalar(select(DataVersion.version).where(DataVersion.name == name)) or 0
+
+
+def bump_data_version(name):
+    """Increment the counter for `name` in the current transaction, before it commits; returns the new value"""
+    version = db.session.scalar(
+        update(DataVersion).where(DataVersion.name == name)
+        .values(version=DataVersion.version + 1).returning(DataVersion.version),
+        execution_options={'synchronize_session': False}
+    )
+    if version is None:
+        db.session.add(DataVersion(name=name, version=1))
+        db.session.flush()
+        version = 1
+    return version
@@ -0,0 +1,141 @@
+"""Transit feed versioning.
+
+Transit data lives in its own SQLite file, separate from user/chat data.
+Each import builds a brand new file (transit-<version>.db) and publishes it
+by atomically replacing a small pointer file (transit.current). Workers
+check the pointer before each request and, when it changes, dispose of
+their pooled transit connections and drop any in-memory caches registered
+with on_feed_change(), so a new feed is picked up without a restart.
+
+A feed version may also carry a read-only binary snapshot (transit-<version>.snap,
+see models/transit.py) that workers memory-map instead of querying SQLite.
+"""
+
+import json
+import os
+import threading
+from sqlalchemy import event
+
+POINTER_FILE = 'transit.current'
+DEFAULT_DB_FILE = 'transit.db'
+
+_callbacks = []
+_lock = threading.Lock()
+_state = {'directory': None, 'mtime': None, 'version': None}
+
+
+def on_feed_change(callback):
+    """Register a callback to run when a new transit feed version is published"""
+    _callbacks.append(callback)
+    return callback
+
+
+def read_pointer(directory):
+    """Read the published feed pointer, or None if no feed has been published"""
+    try:
+        with open(os.path.join(directory, POINTER_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def current_db_path(directory):
+    """Path of the transit database file that should currently be served"""
+    pointer = read_pointer(directory)
+    if pointer:
+        return os.path.join(directory, pointer['file'])
+    return os.path.join(directory, DEFAULT_DB_FILE)
+
+
+def current_snapshot_path(directory=None):
+    """Path of the current feed's binary snapshot, or None if it has none"""
+    directory = directory or _state['directory']
+    pointer = read_pointer(directory) if directory else None
+    if pointer and pointer.get('snapshot'):
+        return os.path.join(directory, pointer['snapshot'])
+    return None
+
+
+def current_version():
+    """Version string of the feed this worker is serving (None before the first import)"""
+    return _state['version']
+
+
+def publish(directory, build_path, version, snapshot_path=None):
+    """Atomically make a fully built transit database the current feed.
+
+    The build files are renamed into place under versioned names, then the
+    pointer is swapped with os.replace so readers only ever see the old or
+    the new version. Older versions (except the previous one) are removed.
+    """
+    previous = read_pointer(directory)
+    filename = f'transit-{version}.db'
+    os.replace(build_path, os.path.join(directory, filename))
+
+    pointer = {'version': version, 'file': filename}
+    if snapshot_path:
+        pointer['snapshot'] = f'transit-{version}.snap'
+        os.replace(snapshot_path, os.path.join(directory, pointer['snapshot']))
+
+    pointer_tmp = os.path.join(directory, POINTER_FILE + '.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(directory, POINTER_FILE))
+
+    # Keep the previous version around for rollback, remove anything older
+    keep = set(pointer.values())
+    if previous:
+        keep.update(previous.values())
+    for name in os.listdir(directory):
+        if name.startswith('transit-') and name.endswith(('.db', '.snap')) and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def check_for_new_version(engine):
+    """Pick up a newly published feed, if any (cheap: one stat per call)"""
+    directory = _state['directory']
+    try:
+        mtime = os.stat(os.path.join(directory, POINTER_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if mtime == _state['mtime']:
+        return
+
+    with _lock:
+        if mtime == _state['mtime']:
+            return
+        pointer = read_pointer(directory)
+        version = pointer['version'] if pointer else None
+        _state['mtime'] = mtime
+        if version == _state['version']:
+            return
+        _state['version'] = version
+        engine.dispose()
+        for callback in _callbacks:
+            callback()
+
+
+def init_app(app, engine, directory):
+    """Route transit connections to the current feed file and watch for new versions"""
+    _state['directory'] = directory
+
+    @event.listens_for(engine, 'do_connect')
+    def connect_current_feed(dialect, conn_rec, cargs, cparams):
+        cargs[:] = [current_db_path(directory)]
+
+    pointer = read_pointer(directory)
+    _state['version'] = pointer['version'] if pointer else None
+    try:
+        _state['mtime'] = os.stat(os.path.join(directory, POINTER_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        _state['mtime'] = None
+
+    @app.before_request
+    def check_feed_version():
+        check_for_new_version(engine)
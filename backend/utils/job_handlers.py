@@ -0,0 +1,200 @@
+"""Standard background jobs (see utils/jobs.py).
+
+- import_feed: build and publish the GTFS feed in data/ (import_gtfs.py)
+- rebuild_indexes: rebuild the message search index, then have every web
+  worker rebuild its amenity, commute and route match indexes
+- warm_caches: read the current feed files into the OS page cache (shared
+  by every process), then have every web worker load its transit caches,
+  e.g. after a deploy or import
+- analyze / vacuum: SQLite maintenance of the chat database (transit feeds
+  are analyzed when they are built and never modified afterwards)
+- archive_messages: move old chat messages to the cold tier
+
+A job runs in one process (a sidecar, or whichever web worker claimed it)
+but the in-memory indexes and caches live in every web worker. So
+rebuild_indexes and warm_caches bump a data version
+(utils/data_version.py), and each web worker checks those versions
+every REFRESH_CHECK_SECONDS from a background thread, refreshing its own
+copies when one moved (see ProcessRefresh).
+"""
+
+import os
+import time
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import text
+from models import db
+from models.transit import get_route_service, get_snapshot
+from utils import feed
+from utils.amenities import get_amenity_index, invalidate_amenity_index
+from utils.background import ProcessThreads
+from utils.commute_matching import get_commute_index, refresh_commute_index
+from utils.data_version import data_version, bump_data_version
+from utils.jobs import job_handler
+from utils.message_archive import archive_messages
+from utils.realtime import get_static_trips
+from utils.route_matching import get_route_match_index, invalidate_route_match_index
+from utils.transit_store import get_transit_store
+
+READ_CHUNK_SIZE = 1 << 20
+REFRESH_CHECK_SECONDS = 5
+
+
+def transit_dir():
+    return os.path.dirname(db.engines['transit'].url.database)
+
+
+@job_handler('import_feed')
+def import_feed(job, data_dir=None):
+    """Build and publish the GTFS feed, then switch this process to it"""
+    from import_gtfs import import_feed as build_and_publish  # the script imports the app
+
+    data_dir = data_dir or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+    start = time.time()
+    version = build_and_publish(data_dir, progress=job.progress)
+    feed.check_for_new_version(db.engines['transit'])
+    return {'version': version, 'seconds': round(time.time() - start, 2)}
+
+
+def rebuild_process_indexes():
+    """Rebuild this process's in-memory matching indexes"""
+    invalidate_amenity_index()
+    get_amenity_index()
+    invalidate_route_match_index()
+    get_route_match_index()
+    refresh_commute_index().join()
+
+
+def warm_process_caches():
+    """Load this process's transit caches"""
+    get_snapshot()
+    get_transit_store()
+    get_route_service()
+    get_amenity_index()
+    get_static_trips()
+    get_commute_index(wait=True)
+
+
+@job_handler('rebuild_indexes')
+def rebuild_indexes(job):
+    """Rebuild the full-text message index, and signal web workers to rebuild their in-memory indexes"""
+    result = {}
+    if db.engine.dialect.name == 'sqlite':
+        job.progress(0.0, 'Rebuilding message search index')
+        start = time.time()
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"))
+        result['message_search_seconds'] = round(time.time() - start, 2)
+
+    result['version'] = bump_data_version('rebuild_indexes')
+    db.session.commit()
+    return result
+
+
+@job_handler('warm_caches')
+def warm_caches(job):
+    """Pull the current feed into the page cache, and signal web workers to load their transit caches"""
+    feed.check_for_new_version(db.engines['transit'])
+    paths = [feed.current_db_path(transit_dir()), feed.current_snapshot_path(transit_dir())]
+    read = 0
+    for path in filter(None, paths):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                while chunk := f.read(READ_CHUNK_SIZE):
+                    read += len(chunk)
+    job.progress(0.5, f"Read {read >> 20} MB of feed files")
+
+    version = bump_data_version('warm_caches')
+    db.session.commit()
+    return {'bytes_read': read, 'version': version}
+
+
+@job_handler('analyze')
+def analyze(job):
+    """Refresh the query planner's statistics for the chat database"""
+    with db.engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+        if db.engine.dialect.name == 'sqlite':
+            conn.execute(text("PRAGMA optimize"))
+
+
+def database_bytes(conn):
+    return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+
+@job_handler('vacuum')
+def vacuum(job):
+    """Rewrite the chat database to reclaim space (e.g. after archiving messages)"""
+    if db.engine.dialect.name != 'sqlite':
+        return None
+    # VACUUM can't run inside a transaction
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        size_before = database_bytes(conn)
+        conn.execute(text("VACUUM"))
+        return {'bytes_before': size_before, 'bytes_after': database_bytes(conn)}
+
+
+@job_handler('archive_messages')
+def archive_old_messages(job, days=None):
+    """Archive chat messages older than `days` (default MESSAGE_ARCHIVE_AFTER_DAYS)"""
+    days = days or current_app.config['MESSAGE_ARCHIVE_AFTER_DAYS']
+    chats, messages = archive_messages(
+        db.session, timedelta(days=days), current_app.config['MESSAGE_ARCHIVE_BLOCK_SIZE']
+    )
+    return {'chats': chats, 'messages': messages}
+
+
+class ProcessRefresh:
+    """Runs this process's part of rebuild_indexes / warm_caches after either job ran anywhere.
+
+    A watcher thread compares the data versions every REFRESH_CHECK_SECONDS,
+    so idle workers refresh too. Versions start out as 0 (never run): a
+    worker started after a run (e.g. by a deploy) refreshes on its first check.
+    """
+
+    def __init__(self, app, actions):
+        self.app = app
+        self.actions = actions  # data version name -> function refreshing this process
+        self.seen = {name: 0 for name in actions}
+        self.threads = ProcessThreads([('process-refresh', self.watch)])
+
+    def check(self):
+        """Run the refresh for each data version that moved since the last check"""
+        for name, action in self.actions.items():
+            version = data_version(name)
+            if version == self.seen[name]:
+                continue
+            self.seen[name] = version
+            try:
+                action()
+            except Exception as e:
+                print(f"[jobs] {name} in process {os.getpid()} failed: {e}")
+
+    def watch(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"[jobs] checking for cache refreshes failed: {e}")
+            time.sleep(REFRESH_CHECK_SECONDS)
+
+
+def init_process_refresh(app):
+    """Watch for rebuild_indexes / warm_caches runs in each web worker, if PROCESS_REFRESH is set"""
+    if not app.config['PROCESS_REFRESH']:
+        return None
+
+    refresh = ProcessRefresh(app, {
+        'rebuild_indexes': rebuild_process_indexes,
+        'warm_caches': warm_process_caches
+    })
+    # Start now, and again in each forked worker, rather than waiting for a request
+    refresh.threads.start_in_each_process()
+
+    @app.before_request
+    def start_process_refresh():
+        refresh.threads.ensure_started()
+
+    return refresh
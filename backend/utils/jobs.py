@@ -0,0 +1,305 @@
+"""Background jobs backed by the jobs table (no external broker).
+
+Handlers are plain functions registered with @job_handler(name) and called
+as handler(job, **args), where job.progress(fraction, message) records
+progress. enqueue() adds a row; a JobRunner's worker threads claim due rows
+(status 'queued', run_at in the past) with a conditional UPDATE, so any
+number of runner processes can share the table. A failed attempt is
+retried after JOB_RETRY_BACKOFF_SECONDS, doubling each time, until
+max_attempts; a running job whose heartbeat is older than
+JOB_STALE_SECONDS (its process died) is requeued.
+
+A scheduler thread enqueues JOB_SCHEDULE entries, cron style
+("minute hour day month weekday handler; ..."). Each scheduled run has a
+dedupe key, so it is enqueued once however many processes run a scheduler.
+
+The runner is started in each web worker with JOBS_IN_PROCESS=1, or as a
+sidecar with `python run_jobs.py`.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.job import Job
+from utils.background import ProcessThreads
+
+HANDLERS = {}
+
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes
+HEARTBEAT_INTERVAL = 30.0
+
+
+def job_handler(name):
+    """Register a function as the handler for jobs called `name`"""
+    def register(f):
+        HANDLERS[name] = f
+        return f
+    return register
+
+
+def enqueue(name, args=None, run_at=None, max_attempts=3, dedupe_key=None):
+    """Queue a job. Returns the Job, or None if dedupe_key was already used."""
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown job: {name}")
+    job = Job(
+        name=name,
+        args=json.dumps(args or {}),
+        run_at=run_at or datetime.utcnow(),
+        max_attempts=max_attempts,
+        dedupe_key=dedupe_key
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if dedupe_key is None:
+            raise
+        return None
+    return job
+
+
+class CronSchedule:
+    """A five-field cron expression: minute hour day-of-month month day-of-week (0=Sunday)"""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        # Like cron: if both day fields are restricted, either may match
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = map(int, part.split('-'))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return frozenset(values)
+
+    def matches(self, moment):
+        if moment.minute not in self.minutes or moment.hour not in self.hours \
+                or moment.month not in self.months:
+            return False
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+
+def parse_schedule(spec):
+    """'m h dom mon dow handler; ...' -> [(CronSchedule, handler name)]"""
+    entries = []
+    for entry in filter(None, (entry.strip() for entry in (spec or '').split(';'))):
+        expression, _, name = entry.rpartition(' ')
+        entries.append((CronSchedule(expression), name))
+    return entries
+
+
+class JobContext:
+    """Passed to handlers as `job`: its row id, attempt and progress reporting"""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.name = job.name
+        self.attempt = job.attempts
+        self._last_progress = 0.0
+
+    def progress(self, fraction, message=None):
+        """Record progress (0..1); writes are throttled to one per PROGRESS_INTERVAL"""
+        now = time.monotonic()
+        if now - self._last_progress < PROGRESS_INTERVAL and fraction < 1:
+            return
+        self._last_progress = now
+        db.session.execute(update(Job).where(Job.id == self.id).values(
+            progress=fraction,
+            progress_message=message[:200] if message else None,
+            heartbeat_at=datetime.utcnow()
+        ))
+        db.session.commit()
+
+
+class JobRunner:
+    """Worker threads that run queued jobs, plus the scheduler thread"""
+
+    def __init__(self, app, workers=2, poll_seconds=1.0, schedule=(), retry_backoff_seconds=30,
+                 stale_seconds=600):
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.schedule = list(schedule)
+        self.retry_backoff = retry_backoff_seconds
+        self.stale_after = timedelta(seconds=stale_seconds)
+        self.running = set()  # ids of jobs running in this process
+        self.threads = ProcessThreads(
+            [(f'job-worker-{n}', self._work) for n in range(workers)] + [('job-scheduler', self._schedule)],
+            on_start=self.running.clear
+        )
+
+    def claim(self):
+        """Mark the next due job as running in this process and return it, or None"""
+        now = datetime.utcnow()
+        while True:
+            job_id = db.session.scalar(
+                select(Job.id).where(Job.status == 'queued', Job.run_at <= now)
+                .order_by(Job.run_at, Job.id).limit(1)
+            )
+            if job_id is None:
+                db.session.rollback()
+                return None
+            claimed = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                status='running',
+                attempts=Job.attempts + 1,
+                worker=f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}",
+                started_at=now,
+                heartbeat_at=now,
+                finished_at=None,
+                progress=0.0,
+                progress_message=None
+            )).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+            # Another worker took it first; try the next one
+
+    def run(self, job):
+        """Run a claimed job and record the outcome"""
+        self.running.add(job.id)
+        context = JobContext(job)
+        try:
+            handler = HANDLERS.get(job.name)
+            if handler is None:
+                raise LookupError(f"No handler registered for job {job.name!r}")
+            result = handler(context, **json.loads(job.args or '{}'))
+        except Exception:
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            job.error = traceback.format_exc()[-4000:]
+            job.finished_at = datetime.utcnow()
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.run_at = job.finished_at + timedelta(seconds=self.retry_backoff * 2 ** (job.attempts - 1))
+            else:
+                job.status = 'failed'
+            print(f"[jobs] {job.name} #{job.id} attempt {job.attempts} failed: {job.error.splitlines()[-1]}")
+        else:
+            job = db.session.get(Job, job.id)
+            job.status = 'succeeded'
+            job.progress = 1.0
+            job.result = json.dumps(result) if result is not None else None
+            job.error = None
+            job.finished_at = datetime.utcnow()
+        finally:
+            self.running.discard(context.id)
+        db.session.commit()
+        return job
+
+    def run_pending(self):
+        """Run due jobs until there are none left (used by the worker threads and tests)"""
+        count = 0
+        while True:
+            job = self.claim()
+            if job is None:
+                return count
+            self.run(job)
+            count += 1
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    ran = self.run_pending()
+            except Exception as e:
+                print(f"[jobs] worker error: {e}")
+                ran = 0
+            if not ran:
+                time.sleep(self.poll_seconds)
+
+    def enqueue_scheduled(self, moment):
+        """Enqueue the schedule entries due at a minute (once across processes)"""
+        for cron, name in self.schedule:
+            if cron.matches(moment):
+                enqueue(name, dedupe_key=f"{name}@{moment:%Y-%m-%dT%H:%M}")
+
+    def heartbeat(self):
+        """Refresh heartbeats of jobs running here, and requeue jobs whose process died"""
+        now = datetime.utcnow()
+        if self.running:
+            db.session.execute(update(Job).where(Job.id.in_(list(self.running))).values(heartbeat_at=now))
+        stale = (Job.status == 'running') & (Job.heartbeat_at < now - self.stale_after)
+        db.session.execute(update(Job).where(stale, Job.attempts < Job.max_attempts).values(
+            status='queued', run_at=now, error='Worker stopped responding'
+        ))
+        db.session.execute(update(Job).where(stale).values(
+            status='failed', finished_at=now, error='Worker stopped responding'
+        ))
+        db.session.commit()
+
+    def _schedule(self):
+        last_minute = datetime.utcnow().replace(second=0, microsecond=0)
+        last_heartbeat = 0.0
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                with self.app.app_context():
+                    minute = datetime.utcnow().replace(second=0, microsecond=0)
+                    while last_minute < minute:
+                        last_minute += timedelta(minutes=1)
+                        self.enqueue_scheduled(last_minute)
+                    if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                        self.heartbeat()
+                        last_heartbeat = time.monotonic()
+            except Exception as e:
+                print(f"[jobs] scheduler error: {e}")
+
+
+def create_runner(app):
+    """A JobRunner configured from app.config, with the standard handlers registered"""
+    from utils import job_handlers  # noqa: F401 (registers the handlers)
+    return JobRunner(
+        app,
+        workers=app.config['JOB_WORKERS'],
+        poll_seconds=app.config['JOB_POLL_SECONDS'],
+        schedule=parse_schedule(app.config['JOB_SCHEDULE']),
+        retry_backoff_seconds=app.config['JOB_RETRY_BACKOFF_SECONDS'],
+        stale_seconds=app.config['JOB_STALE_SECONDS']
+    )
+
+
+def init_jobs(app):
+    """Register the job handlers, and run jobs in each web worker if JOBS_IN_PROCESS is set"""
+    from utils.job_handlers import init_process_refresh  # job_handlers imports this module
+    runner = create_runner(app)
+    app.extensions['job_runner'] = runner
+    init_process_refresh(app)
+    if not app.config['JOBS_IN_PROCESS']:
+        return runner
+
+    @app.before_request
+    def start_job_runner():
+        runner.threads.ensure_started()
+
+    return runner
@@ -0,0 +1,265 @@
+"""Hot/cold tiering for chat messages.
+
+Messages older than MESSAGE_ARCHIVE_AFTER_DAYS are moved out of the
+messages table (the hot tier) into per-chat MessageArchive blocks of about
+MESSAGE_ARCHIVE_BLOCK_SIZE messages (the cold tier), keeping the hot table
+and idx_chat_created small. A block is the block's rows packed back to back,
+each as a fixed header (id, sender_id, created_at in microseconds since the
+epoch, content length) followed by the UTF-8 content, then compressed with
+zstd if the zstandard package is installed, or zlib.
+
+Within a chat every archived message is older, in (created_at, id) order,
+than every hot one, so reading backwards goes hot tier first and then
+archive blocks newest first. The newest message of each chat always stays
+hot: it's the chat's last_message, and keeping the highest id in the table
+stops SQLite from handing out archived ids again.
+
+Archived messages are removed from the full-text index along with the hot
+rows, so search only covers the hot tier.
+"""
+
+import base64
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_, select
+from models.user import User
+from models.chat import Message, MessageArchive
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+ROW_HEADER = struct.Struct('<qqqI')  # id, sender_id, created_at (µs since epoch), content length
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+MESSAGE_COLUMNS = (Message.id, Message.sender_id, Message.created_at, Message.content)
+
+
+def pack_messages(rows):
+    """Pack (id, sender_id, created_at, content) rows into bytes"""
+    parts = []
+    for message_id, sender_id, created_at, content in rows:
+        data = content.encode()
+        parts.append(ROW_HEADER.pack(message_id, sender_id, (created_at - EPOCH) // MICROSECOND, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def unpack_messages(data):
+    """Inverse of pack_messages()"""
+    rows = []
+    offset = 0
+    while offset < len(data):
+        message_id, sender_id, micros, length = ROW_HEADER.unpack_from(data, offset)
+        offset += ROW_HEADER.size
+        content = data[offset:offset + length].decode()
+        offset += length
+        rows.append((message_id, sender_id, EPOCH + micros * MICROSECOND, content))
+    return rows
+
+
+def compress_block(data):
+    """Compress packed rows, returning (codec, compressed)"""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def read_block(codec, data):
+    """Decompress and unpack an archive block's rows, oldest first"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('The zstandard package is required to read zstd archive blocks')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+    return unpack_messages(data)
+
+
+def archive_chat(session, chat_id, cutoff, block_size):
+    """Move a chat's messages created before cutoff into archive blocks.
+
+    Returns the number of messages archived. The caller commits.
+    """
+    newest_id = session.execute(
+        select(Message.id).where(Message.chat_id == chat_id)
+        .order_by(Message.created_at.desc(), Message.id.desc()).limit(1)
+    ).scalar()
+    max_id = session.execute(select(func.max(Message.id))).scalar()
+
+    rows = []
+    for row in session.execute(
+        select(*MESSAGE_COLUMNS).where(Message.chat_id == chat_id, Message.created_at < cutoff)
+        .order_by(Message.created_at, Message.id)
+    ):
+        if row.id in (newest_id, max_id):
+            break
+        rows.append(tuple(row))
+
+    if not rows:
+        return 0
+
+    # Top up the chat's newest block rather than leaving a trail of small ones
+    pending = []
+    last_block = session.execute(
+        select(MessageArchive).where(MessageArchive.chat_id == chat_id)
+        .order_by(MessageArchive.first_created_at.desc(), MessageArchive.first_message_id.desc()).limit(1)
+    ).scalar()
+    if last_block is not None and last_block.message_count < block_size:
+        pending = read_block(last_block.codec, last_block.data)
+        session.delete(last_block)
+    pending += rows
+
+    for offset in range(0, len(pending), block_size):
+        block = pending[offset:offset + block_size]
+        codec, data = compress_block(pack_messages(block))
+        session.add(MessageArchive(
+            chat_id=chat_id,
+            message_count=len(block),
+            first_created_at=block[0][2],
+            first_message_id=block[0][0],
+            last_created_at=block[-1][2],
+            last_message_id=block[-1][0],
+            codec=codec,
+            data=data
+        ))
+
+    for offset in range(0, len(rows), block_size):
+        session.execute(Message.__table__.delete().where(
+            Message.id.in_([row[0] for row in rows[offset:offset + block_size]])
+        ))
+    return len(rows)
+
+
+def archive_messages(session, older_than, block_size):
+    """Archive every chat's messages older than the given timedelta, one transaction per chat.
+
+    Returns (chats, messages) archived.
+    """
+    cutoff = datetime.utcnow() - older_than
+    chat_ids = session.execute(
+        select(Message.chat_id).where(Message.created_at < cutoff).distinct()
+    ).scalars().all()
+
+    chats = messages = 0
+    for chat_id in chat_ids:
+        try:
+            archived = archive_chat(session, chat_id, cutoff, block_size)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        if archived:
+            chats += 1
+            messages += archived
+    return chats, messages
+
+
+class Usernames(dict):
+    """user id -> username, looked up on first use"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def __missing__(self, user_id):
+        username = self.session.execute(select(User.username).where(User.id == user_id)).scalar()
+        self[user_id] = username
+        return username
+
+
+def message_to_dict(chat_id, row, usernames):
+    """Same shape as Message.to_dict(), for a (id, sender_id, created_at, content) row"""
+    message_id, sender_id, created_at, content = row
+    return {
+        'id': message_id,
+        'chat_id': chat_id,
+        'sender_id': sender_id,
+        'sender_username': usernames[sender_id],
+        'content': content,
+        'created_at': created_at.isoformat() + 'Z'  # Add Z to indicate UTC
+    }
+
+
+def encode_cursor(row):
+    message_id, _, created_at, _ = row
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), message_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor into a (created_at, id) key. Raises ValueError if it is malformed."""
+    try:
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def iter_chat_messages(session, chat_id):
+    """Yield every message in a chat as dicts, oldest first, reading through both tiers"""
+    usernames = Usernames(session)
+
+    block_ids = session.execute(
+        select(MessageArchive.id).where(MessageArchive.chat_id == chat_id)
+        .order_by(MessageArchive.first_created_at, MessageArchive.first_message_id)
+    ).scalars().all()
+    for block_id in block_ids:
+        # One block in memory at a time
+        codec, data = session.execute(
+            select(MessageArchive.codec, MessageArchive.data).where(MessageArchive.id == block_id)
+        ).one()
+        for row in read_block(codec, data):
+            yield message_to_dict(chat_id, row, usernames)
+
+    hot = session.execute(
+        select(*MESSAGE_COLUMNS).where(Message.chat_id == chat_id)
+        .order_by(Message.created_at, Message.id).execution_options(yield_per=500)
+    )
+    for row in hot:
+        yield message_to_dict(chat_id, tuple(row), usernames)
+
+
+def page_chat_messages(session, chat_id, before=None, limit=50):
+    """Get the `limit` messages immediately before the cursor (the newest if None).
+
+    Returns (messages oldest first, cursor for the page before them or None
+    at the start of the chat). Raises ValueError for a malformed cursor.
+    """
+    key = decode_cursor(before) if before else None
+
+    query = select(*MESSAGE_COLUMNS).where(Message.chat_id == chat_id)
+    if key is not None:
+        query = query.where(or_(
+            Message.created_at < key[0],
+            and_(Message.created_at == key[0], Message.id < key[1])
+        ))
+    rows = [tuple(row) for row in session.execute(
+        query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    )]
+
+    if len(rows) <= limit:
+        # Ran out of hot messages; continue into the archive, newest block first
+        blocks = select(MessageArchive.codec, MessageArchive.data).where(MessageArchive.chat_id == chat_id)
+        if key is not None:
+            blocks = blocks.where(or_(
+                MessageArchive.first_created_at < key[0],
+                and_(MessageArchive.first_created_at == key[0], MessageArchive.first_message_id < key[1])
+            ))
+        blocks = blocks.order_by(MessageArchive.first_created_at.desc(), MessageArchive.first_message_id.desc())
+        for codec, data in session.execute(blocks.execution_options(yield_per=1)):
+            for row in reversed(read_block(codec, data)):
+                if key is None or (row[2], row[0]) < key:
+                    rows.append(row)
+            if len(rows) > limit:
+                break
+
+    next_before = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    page = rows[:limit]
+    page.reverse()
+
+    usernames = Usernames(session)
+    return [message_to_dict(chat_id, row, usernames) for row in page], next_before
@@ -0,0 +1,141 @@
+"""Full-text message search backed by a SQLite FTS5 external-content table.
+
+messages_fts indexes messages.content without storing a second copy of it
+(content='messages'); triggers on messages keep it in sync, so inserts from
+both send_message and the write-behind writer are indexed automatically.
+
+chat_id is indexed as a second FTS column so a search is restricted to the
+caller's chats inside the MATCH itself; only messages that both contain the
+terms and belong to those chats are ranked. It carries zero weight in bm25.
+
+Only hot messages are searchable: archiving a message (utils/message_archive.py)
+deletes it from messages, and the delete trigger drops it from the index.
+"""
+
+import base64
+import html
+import json
+from sqlalchemy import inspect, text
+
+# Private-use characters mark matches in snippets until the text is HTML-escaped
+SNIPPET_START = '\ue000'
+SNIPPET_END = '\ue001'
+
+FTS_TABLE_DDL = (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, chat_id, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+
+FTS_TRIGGERS_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, chat_id) VALUES (new.id, new.content, new.chat_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, chat_id)
+        VALUES ('delete', old.id, old.content, old.chat_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, chat_id ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, chat_id)
+        VALUES ('delete', old.id, old.content, old.chat_id);
+        INSERT INTO messages_fts(rowid, content, chat_id) VALUES (new.id, new.content, new.chat_id);
+    END""",
+]
+
+SEARCH_SQL = f"""
+    SELECT m.id, m.chat_id, m.sender_id, m.created_at, u.username AS sender_username,
+           snippet(messages_fts, 0, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16) AS snippet,
+           messages_fts.rank AS rank
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN chat_participants cp ON cp.chat_id = m.chat_id AND cp.user_id = :user_id
+    JOIN "user" u ON u.id = m.sender_id
+    WHERE messages_fts MATCH :query
+      AND (:after_rank IS NULL
+           OR messages_fts.rank > :after_rank
+           OR (messages_fts.rank = :after_rank AND m.id > :after_id))
+    ORDER BY messages_fts.rank, m.id
+    LIMIT :limit
+"""
+
+
+def init_message_search(engine):
+    """Create the FTS index and its triggers if missing (indexing any existing messages)"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.begin() as conn:
+        if not inspect(conn).has_table('messages_fts'):
+            conn.execute(text(FTS_TABLE_DDL))
+            conn.execute(text("INSERT INTO messages_fts(messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"))
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+        for ddl in FTS_TRIGGERS_DDL:
+            conn.execute(text(ddl))
+    return True
+
+
+def build_match_query(raw, chat_ids):
+    """Turn user input into a safe FTS5 query.
+
+    Every term must match and the message must be in one of the given chats.
+    """
+    terms = [term.replace('"', '""') for term in raw.split()]
+    if not terms or not chat_ids:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    chats = ' OR '.join(str(int(chat_id)) for chat_id in chat_ids)
+    return f"content : ({' '.join(quoted)}) AND chat_id : ({chats})"
+
+
+def encode_cursor(rank, message_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, message_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor. Raises ValueError if it is malformed."""
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(message_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def highlight(snippet):
+    """HTML-escape a snippet and wrap the matched terms in <mark> tags"""
+    return html.escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def search_messages(session, user_id, raw_query, limit=20, cursor=None):
+    """Search messages in the user's chats, best match first.
+
+    Returns (results, next_cursor); next_cursor is None on the last page.
+    """
+    chat_ids = [row[0] for row in session.execute(
+        text("SELECT chat_id FROM chat_participants WHERE user_id = :user_id"), {'user_id': user_id}
+    )]
+    query = build_match_query(raw_query, chat_ids)
+    if query is None:
+        return [], None
+
+    after_rank, after_id = decode_cursor(cursor) if cursor else (None, None)
+    rows = session.execute(text(SEARCH_SQL), {
+        'user_id': user_id,
+        'query': query,
+        'after_rank': after_rank,
+        'after_id': after_id,
+        'limit': limit + 1
+    }).fetchall()
+
+    results = [{
+        'id': row.id,
+        'chat_id': row.chat_id,
+        'sender_id': row.sender_id,
+        'sender_username': row.sender_username,
+        'snippet': highlight(row.snippet),
+        'created_at': str(row.created_at).replace(' ', 'T') + 'Z'  # Add Z to indicate UTC
+    } for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.rank, last.id)
+    return results, next_cursor
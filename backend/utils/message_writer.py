@@ -0,0 +1,163 @@
+"""Write-behind group commit for chat messages.
+
+Validated messages are queued in-process and a single writer thread flushes
+them in groups. An idle writer flushes a message as soon as it arrives;
+messages that arrive while a flush is in flight queue up and go out
+together in the next one, capped at CHAT_FLUSH_MAX_MESSAGES. Batches grow
+with load without ever holding a lone sender back. Each group is one
+multi-row insert (ids assigned by the database and returned) plus one bulk
+chats.updated_at update, in one transaction.
+Senders block until the group containing their message has committed, so an
+acknowledgement is still a durable write. A sender that gives up waiting
+withdraws its message if no flush has taken it yet; otherwise it waits for
+that flush to finish, so a failed send is never written later.
+"""
+
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import update
+from models.chat import Chat, Message
+from utils.background import ProcessThreads
+
+
+class PendingMessage:
+    """A queued message; wait() blocks until it is committed"""
+
+    def __init__(self, chat_id, sender_id, content):
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.content = content
+        self.id = None
+        self.created_at = None
+        self.error = None
+        self.taken = False  # claimed by a flush
+        self.cancelled = False
+        self._done = threading.Event()
+        self._state_lock = threading.Lock()
+
+    def take(self):
+        """Claim the message for a flush; False if the sender already withdrew it"""
+        with self._state_lock:
+            if self.cancelled:
+                return False
+            self.taken = True
+            return True
+
+    def cancel(self):
+        """Withdraw the message unless a flush has taken it; returns whether it was withdrawn"""
+        with self._state_lock:
+            if self.taken:
+                return False
+            self.cancelled = True
+            return True
+
+    def wait(self, timeout=None):
+        """Wait for the flush. Returns self, raises if the flush failed.
+
+        On timeout a message still in the queue is withdrawn and TimeoutError
+        raised; one already being flushed is waited for until it commits or fails.
+        """
+        if not self._done.wait(timeout):
+            if self.cancel():
+                raise TimeoutError('Timed out waiting for message to be written; it was not sent')
+            self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def resolve(self, message_id, created_at):
+        self.id = message_id
+        self.created_at = created_at
+        self._done.set()
+
+    def fail(self, error):
+        self.error = error
+        self._done.set()
+
+
+class MessageWriter:
+    """Single background writer that group-commits queued messages"""
+
+    def __init__(self, engine, max_messages=100):
+        self.engine = engine
+        self.max_messages = max_messages
+        self.queue = queue.Queue()
+        self.threads = ProcessThreads([('message-writer', self._run)])
+
+    def submit(self, chat_id, sender_id, content):
+        """Queue a message for the next group commit"""
+        self.threads.ensure_started()
+        pending = PendingMessage(chat_id, sender_id, content)
+        self.queue.put(pending)
+        return pending
+
+    def _run(self):
+        # The writer keeps its own connection, so it never competes with
+        # request threads for a pooled one
+        conn = None
+        while True:
+            # Wait for a message, then take whatever else queued up meanwhile
+            # (during the previous flush) without waiting for more, up to
+            # max_messages, skipping any the sender has withdrawn
+            batch = []
+            pending = self.queue.get()
+            while True:
+                if pending.take():
+                    batch.append(pending)
+                if len(batch) >= self.max_messages:
+                    break
+                try:
+                    pending = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+            if conn is None:
+                conn = self.engine.connect()
+            if not self.flush(conn, batch):
+                conn.close()
+                conn = None
+
+    def flush(self, conn, batch):
+        """Write a group of messages in a single transaction. Returns False on failure."""
+        now = datetime.utcnow()
+        try:
+            with conn.begin():
+                # One multi-row INSERT ... RETURNING; the ids come back in batch order
+                message_ids = conn.execute(
+                    Message.__table__.insert().returning(Message.id, sort_by_parameter_order=True),
+                    [{
+                        'chat_id': pending.chat_id,
+                        'sender_id': pending.sender_id,
+                        'content': pending.content,
+                        'created_at': now
+                    } for pending in batch]
+                ).scalars().all()
+                conn.execute(
+                    update(Chat)
+                    .where(Chat.id.in_({pending.chat_id for pending in batch}))
+                    .values(updated_at=now)
+                )
+        except Exception as e:
+            for pending in batch:
+                pending.fail(e)
+            return False
+
+        for pending, message_id in zip(batch, message_ids):
+            pending.resolve(message_id, now)
+        return True
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer(app, engine):
+    """Get the process-wide message writer configured from app.config"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = MessageWriter(engine, max_messages=app.config['CHAT_FLUSH_MAX_MESSAGES'])
+    return _writer
@@ -0,0 +1,167 @@
+"""In-memory presence and typing indicators with timer-wheel expiry.
+
+Presence is a user's last-seen time, refreshed by the heartbeat endpoint
+and by every authenticated request (token_required), and dropped
+PRESENCE_TTL_SECONDS after the last one. Heartbeats never touch the
+database.
+
+Both stores are a TTLWheel: a ring of buckets, one per tick, holding the
+keys last touched during that tick. Touching a key moves it to the current
+bucket only when its tick changed, so repeated touches within a tick are a
+dict lookup. Expiry is lazy: whenever the wheel is used it first empties
+the buckets that have fallen more than a TTL behind, so each key is
+expired once, in O(1), and no sweeper thread is needed.
+
+State is per process. Run one process (e.g. the ASGI mode, asgi.py) or a
+single gunicorn worker for presence to be global; with several workers a
+user only shows as online in workers that served them recently.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime
+
+
+class TTLWheel:
+    """Keys that expire `ttl` seconds after they were last touched, at `tick` resolution"""
+
+    def __init__(self, ttl, tick=1.0, clock=time.time):
+        self.ttl = ttl
+        self.tick = tick
+        self.clock = clock
+        self.ttl_ticks = math.ceil(ttl / tick)
+        self.buckets = [set() for _ in range(self.ttl_ticks + 1)]
+        self.last_seen = {}  # key -> time of the last touch
+        self.key_tick = {}  # key -> tick of the bucket holding it
+        self.expired_through = int(clock() // tick) - self.ttl_ticks  # buckets up to this tick are empty
+        self._lock = threading.Lock()
+
+    def _advance(self, current_tick):
+        """Expire every bucket older than the TTL; returns the keys that expired"""
+        expired = []
+        horizon = current_tick - self.ttl_ticks - 1
+        if horizon - self.expired_through >= len(self.buckets):
+            # Idle for longer than a full turn: everything has expired
+            expired.extend(self.last_seen)
+            for bucket in self.buckets:
+                bucket.clear()
+            self.last_seen.clear()
+            self.key_tick.clear()
+        else:
+            for tick in range(self.expired_through + 1, horizon + 1):
+                bucket = self.buckets[tick % len(self.buckets)]
+                for key in bucket:
+                    del self.last_seen[key]
+                    del self.key_tick[key]
+                expired.extend(bucket)
+                bucket.clear()
+        self.expired_through = max(self.expired_through, horizon)
+        return expired
+
+    def touch(self, key, now=None):
+        """Mark a key as seen now; returns the keys that expired meanwhile"""
+        now = now if now is not None else self.clock()
+        current_tick = int(now // self.tick)
+        with self._lock:
+            expired = self._advance(current_tick) if current_tick - self.ttl_ticks - 1 > self.expired_through else ()
+            self.last_seen[key] = now
+            previous_tick = self.key_tick.get(key)
+            if previous_tick != current_tick:
+                if previous_tick is not None:
+                    self.buckets[previous_tick % len(self.buckets)].discard(key)
+                self.buckets[current_tick % len(self.buckets)].add(key)
+                self.key_tick[key] = current_tick
+        return expired
+
+    def remove(self, key):
+        with self._lock:
+            previous_tick = self.key_tick.pop(key, None)
+            if previous_tick is not None:
+                self.buckets[previous_tick % len(self.buckets)].discard(key)
+                del self.last_seen[key]
+
+    def expire(self):
+        """Expire keys that are past their TTL; returns them"""
+        with self._lock:
+            return self._advance(int(self.clock() // self.tick))
+
+    def get(self, key):
+        """Time a live key was last touched, or None"""
+        seen = self.last_seen.get(key)
+        if seen is not None and self.clock() - seen <= self.ttl:
+            return seen
+        return None
+
+    def get_many(self, keys):
+        """{key: last touched} for the keys that are live"""
+        cutoff = self.clock() - self.ttl
+        last_seen = self.last_seen
+        found = {}
+        for key in keys:
+            seen = last_seen.get(key)
+            if seen is not None and seen >= cutoff:
+                found[key] = seen
+        return found
+
+    def __len__(self):
+        return len(self.last_seen)
+
+
+class TypingIndicators:
+    """Who is typing in which chat, each entry expiring after `ttl` seconds"""
+
+    def __init__(self, ttl, tick=0.5):
+        self.wheel = TTLWheel(ttl, tick)
+        self.by_chat = {}  # chat_id -> user ids with a live (chat_id, user_id) entry
+        self._lock = threading.Lock()
+
+    def _forget(self, expired):
+        for chat_id, user_id in expired:
+            typing = self.by_chat.get(chat_id)
+            if typing is not None:
+                typing.discard(user_id)
+                if not typing:
+                    del self.by_chat[chat_id]
+
+    def start(self, chat_id, user_id):
+        with self._lock:
+            self._forget(self.wheel.touch((chat_id, user_id)))
+            self.by_chat.setdefault(chat_id, set()).add(user_id)
+
+    def stop(self, chat_id, user_id):
+        self.wheel.remove((chat_id, user_id))
+        with self._lock:
+            self._forget([(chat_id, user_id)])
+
+    def in_chat(self, chat_id):
+        """User ids currently typing in a chat"""
+        with self._lock:
+            self._forget(self.wheel.expire())
+            return sorted(self.by_chat.get(chat_id, ()))
+
+
+activity = TTLWheel(60)  # user_id -> last seen
+typing = TypingIndicators(5)
+
+
+def init_presence(app):
+    """Size the stores from app.config"""
+    global activity, typing
+    activity = TTLWheel(app.config['PRESENCE_TTL_SECONDS'])
+    typing = TypingIndicators(app.config['TYPING_TTL_SECONDS'])
+
+
+def seen(user_id):
+    """Record activity from a user (called by token_required on every authenticated request)"""
+    activity.touch(user_id)
+
+
+def mark_online(users, key='user_id'):
+    """Add online / last_seen to serialized users (dicts with the user id under `key`), in one lookup"""
+    last_seen = activity.get_many({user[key] for user in users})
+    for user in users:
+        seen_at = last_seen.get(user[key])
+        user['online'] = seen_at is not None
+        user['last_seen'] = datetime.utcfromtimestamp(seen_at).isoformat() + 'Z' if seen_at is not None else None
+    return users
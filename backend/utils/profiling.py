@@ -0,0 +1,175 @@
+"""Opt-in profiling hooks, installed around app.wsgi_app so routes don't change.
+
+- Sampling profiler (PROFILE_SAMPLING=1): a background thread snapshots the
+  stacks of threads that are handling a request every
+  PROFILE_SAMPLE_INTERVAL_MS and aggregates them across requests. Every
+  PROFILE_FLUSH_SECONDS the totals are written, one "frame;frame;frame count"
+  line per stack, to PROFILE_OUTPUT.<pid>, the collapsed-stack format that
+  flamegraph.pl and speedscope read.
+- Per-request profiling (ADMIN_TOKEN set): a request with ?__profile=1 and a
+  matching X-Admin-Token header runs under cProfile, and the response is
+  replaced by the top functions by cumulative time.
+
+Neither middleware is installed unless enabled, so they cost nothing otherwise.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+from werkzeug.wsgi import ClosingIterator
+from utils.background import ProcessThreads
+
+PROFILE_TOP_FUNCTIONS = 40
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Collapsed-stack key for a frame, outermost call first"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class SamplingProfiler:
+    """Background thread that samples the stacks of request-handling threads"""
+
+    def __init__(self, output_path, interval_ms=10, flush_seconds=30):
+        self.output_path = output_path
+        self.interval = interval_ms / 1000.0
+        self.flush_seconds = flush_seconds
+        self.active = set()  # idents of threads currently handling a request
+        self.stacks = Counter()
+        self.threads = ProcessThreads([('sampling-profiler', self.run)], on_start=self.reset)
+
+    def reset(self):
+        self.active.clear()
+        self.stacks.clear()
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+            if time.monotonic() >= next_flush:
+                self.write()
+                next_flush = time.monotonic() + self.flush_seconds
+
+    def sample(self):
+        if not self.active:
+            return
+        frames = sys._current_frames()
+        for ident in list(self.active):
+            frame = frames.get(ident)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def write(self):
+        """Write the aggregated stacks, replacing the previous file atomically"""
+        if not self.stacks:
+            return
+        path = f"{self.output_path}.{os.getpid()}"
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+
+    def wrap(self, wsgi_app):
+        """WSGI middleware marking threads as sampleable while they handle a request"""
+        def middleware(environ, start_response):
+            self.threads.ensure_started()
+            ident = threading.get_ident()
+            self.active.add(ident)
+            try:
+                app_iter = wsgi_app(environ, start_response)
+            except BaseException:
+                self.active.discard(ident)
+                raise
+            # Streamed bodies are generated after wsgi_app returns, so keep sampling until close
+            return ClosingIterator(app_iter, [lambda: self.active.discard(ident)])
+        return middleware
+
+
+def profile_request(wsgi_app, admin_token):
+    """WSGI middleware that runs ?__profile=1 requests from an admin under cProfile"""
+    def middleware(environ, start_response):
+        if '__profile' not in environ.get('QUERY_STRING', '') \
+                or parse_qs(environ['QUERY_STRING']).get('__profile') != ['1']:
+            return wsgi_app(environ, start_response)
+
+        if not hmac.compare_digest(environ.get('HTTP_X_ADMIN_TOKEN', ''), admin_token):
+            start_response('403 FORBIDDEN', [('Content-Type', 'application/json')])
+            return [b'{"error": "Admin token required to profile requests"}']
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            return lambda data: None
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            app_iter = wsgi_app(environ, capture_start_response)
+            try:
+                size = sum(len(chunk) for chunk in app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+            _, calls, total_time, cumulative_time, _ = stats.stats[func]
+            filename, line, name = func
+            functions.append({
+                'function': f"{name} ({filename}:{line})",
+                'calls': calls,
+                'total_ms': round(total_time * 1000, 3),
+                'cumulative_ms': round(cumulative_time * 1000, 3)
+            })
+
+        body = json.dumps({
+            'status': captured.get('status'),
+            'response_bytes': size,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'functions': functions
+        }).encode()
+        start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+    return middleware
+
+
+def init_app(app):
+    """Install the profiling middleware that is enabled in the config"""
+    if app.config['PROFILE_SAMPLING']:
+        sampler = SamplingProfiler(
+            app.config['PROFILE_OUTPUT'],
+            interval_ms=app.config['PROFILE_SAMPLE_INTERVAL_MS'],
+            flush_seconds=app.config['PROFILE_FLUSH_SECONDS']
+        )
+        app.wsgi_app = sampler.wrap(app.wsgi_app)
+        app.extensions['sampling_profiler'] = sampler
+
+    if app.config['ADMIN_TOKEN']:
+        app.wsgi_app = profile_request(app.wsgi_app, app.config['ADMIN_TOKEN'])
@@ -0,0 +1,527 @@
+"""GTFS-realtime ingestion into an in-memory delta store.
+
+A worker thread polls REALTIME_FEED_URL (a local file path or an http(s)
+URL) every REALTIME_POLL_SECONDS for a TripUpdate / VehiclePosition feed:
+binary protobuf, as real producers publish it (read with the
+gtfs-realtime-bindings package from requirements.txt), or the GTFS-rt JSON
+mapping (what protobuf's json_format produces), which is handy as a local
+stand-in.
+
+Refreshes are cheap when nothing moved: an unchanged file (mtime/size), a
+304 from the server or a byte-identical body is dropped before parsing.
+Otherwise each entity is reduced to an immutable tuple and compared with
+what the store holds, so only trips whose delay, stop predictions or
+vehicle position actually changed are written and published. Nothing
+touches SQLite per update; the set of static trip ids to match against is
+loaded once per feed version.
+
+Every change bumps the store's version. Subscribers registered with
+subscribe() are called with just the changed trips, and HTTP clients can
+ask for the trips changed since the version they last saw.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from models import db
+from models.transit import Trip
+from utils.background import ProcessThreads
+from utils.feed import on_feed_change
+
+try:
+    from google.transit import gtfs_realtime_pb2
+except ImportError:  # in requirements.txt; JSON feeds still work without it
+    gtfs_realtime_pb2 = None
+
+# Field order matters: the last field (timestamp) is ignored when comparing,
+# so a producer re-stamping unchanged data doesn't count as a change
+TripUpdate = namedtuple('TripUpdate', 'route_id start_date schedule_relationship delay stop_time_updates timestamp')
+StopTimeUpdate = namedtuple('StopTimeUpdate', 'stop_sequence stop_id arrival_time arrival_delay '
+                                              'departure_time departure_delay schedule_relationship')
+VehiclePosition = namedtuple('VehiclePosition', 'vehicle_id label latitude longitude bearing speed '
+                                                'stop_id current_status timestamp')
+
+# Enum names for protobuf feeds (JSON feeds already carry the names)
+TRIP_RELATIONSHIPS = {0: 'SCHEDULED', 1: 'ADDED', 2: 'UNSCHEDULED', 3: 'CANCELED', 5: 'REPLACEMENT',
+                      6: 'DUPLICATED', 7: 'DELETED'}
+STOP_RELATIONSHIPS = {0: 'SCHEDULED', 1: 'SKIPPED', 2: 'NO_DATA', 3: 'UNSCHEDULED'}
+VEHICLE_STATUSES = {0: 'INCOMING_AT', 1: 'STOPPED_AT', 2: 'IN_TRANSIT_TO'}
+
+
+class FeedSnapshot:
+    """One parsed feed message"""
+
+    __slots__ = ('full', 'updates', 'positions', 'deleted')
+
+    def __init__(self, full):
+        self.full = full  # FULL_DATASET: trips missing from it are no longer reported
+        self.updates = {}  # trip_id -> TripUpdate
+        self.positions = {}  # trip_id -> VehiclePosition
+        self.deleted = set()  # trip ids of is_deleted entities (DIFFERENTIAL feeds)
+
+
+def _optional_int(value):
+    return int(value) if value is not None else None
+
+
+def _trip_delay(delay, stop_time_updates):
+    """The trip's delay, or failing that the one predicted at its first updated stop"""
+    if delay is not None:
+        return delay
+    for stu in stop_time_updates:
+        if stu.departure_delay is not None:
+            return stu.departure_delay
+        if stu.arrival_delay is not None:
+            return stu.arrival_delay
+    return None
+
+
+def parse_json_feed(doc):
+    """Read a feed in the GTFS-rt JSON mapping (camelCase keys, int64s as strings)"""
+    header = doc.get('header', {})
+    snapshot = FeedSnapshot(header.get('incrementality', 'FULL_DATASET') == 'FULL_DATASET')
+
+    for entity in doc.get('entity', []):
+        trip_update = entity.get('tripUpdate')
+        vehicle = entity.get('vehicle')
+        trip = (trip_update or vehicle or {}).get('trip', {})
+        trip_id = trip.get('tripId')
+        if not trip_id:
+            continue
+        if entity.get('isDeleted'):
+            snapshot.deleted.add(trip_id)
+            continue
+
+        if trip_update is not None:
+            stop_time_updates = tuple(
+                StopTimeUpdate(
+                    _optional_int(stu.get('stopSequence')),
+                    stu.get('stopId'),
+                    _optional_int(stu.get('arrival', {}).get('time')),
+                    _optional_int(stu.get('arrival', {}).get('delay')),
+                    _optional_int(stu.get('departure', {}).get('time')),
+                    _optional_int(stu.get('departure', {}).get('delay')),
+                    stu.get('scheduleRelationship', 'SCHEDULED')
+                )
+                for stu in trip_update.get('stopTimeUpdate', [])
+            )
+            snapshot.updates[trip_id] = TripUpdate(
+                trip.get('routeId'),
+                trip.get('startDate'),
+                trip.get('scheduleRelationship', 'SCHEDULED'),
+                _trip_delay(_optional_int(trip_update.get('delay')), stop_time_updates),
+                stop_time_updates,
+                _optional_int(trip_update.get('timestamp'))
+            )
+
+        if vehicle is not None and 'position' in vehicle:
+            position = vehicle['position']
+            descriptor = vehicle.get('vehicle', {})
+            snapshot.positions[trip_id] = VehiclePosition(
+                descriptor.get('id'),
+                descriptor.get('label'),
+                position.get('latitude'),
+                position.get('longitude'),
+                position.get('bearing'),
+                position.get('speed'),
+                vehicle.get('stopId'),
+                vehicle.get('currentStatus', 'IN_TRANSIT_TO'),
+                _optional_int(vehicle.get('timestamp'))
+            )
+
+    return snapshot
+
+
+def parse_protobuf_feed(data):
+    """Read a GTFS-realtime protobuf FeedMessage"""
+    if gtfs_realtime_pb2 is None:
+        raise RuntimeError('Reading protobuf feeds requires the gtfs-realtime-bindings package '
+                           '(pip install -r requirements.txt)')
+
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.ParseFromString(data)
+    snapshot = FeedSnapshot(message.header.incrementality == gtfs_realtime_pb2.FeedHeader.FULL_DATASET)
+
+    for entity in message.entity:
+        if entity.HasField('trip_update'):
+            trip = entity.trip_update.trip
+        elif entity.HasField('vehicle'):
+            trip = entity.vehicle.trip
+        else:
+            continue
+        trip_id = trip.trip_id
+        if not trip_id:
+            continue
+        if entity.is_deleted:
+            snapshot.deleted.add(trip_id)
+            continue
+
+        if entity.HasField('trip_update'):
+            trip_update = entity.trip_update
+            stop_time_updates = tuple(
+                StopTimeUpdate(
+                    stu.stop_sequence if stu.HasField('stop_sequence') else None,
+                    stu.stop_id or None,
+                    stu.arrival.time if stu.arrival.HasField('time') else None,
+                    stu.arrival.delay if stu.arrival.HasField('delay') else None,
+                    stu.departure.time if stu.departure.HasField('time') else None,
+                    stu.departure.delay if stu.departure.HasField('delay') else None,
+                    STOP_RELATIONSHIPS.get(stu.schedule_relationship, 'SCHEDULED')
+                )
+                for stu in trip_update.stop_time_update
+            )
+            snapshot.updates[trip_id] = TripUpdate(
+                trip.route_id or None,
+                trip.start_date or None,
+                TRIP_RELATIONSHIPS.get(trip.schedule_relationship, 'SCHEDULED'),
+                _trip_delay(trip_update.delay if trip_update.HasField('delay') else None, stop_time_updates),
+                stop_time_updates,
+                trip_update.timestamp or None
+            )
+
+        if entity.HasField('vehicle') and entity.vehicle.HasField('position'):
+            vehicle = entity.vehicle
+            position = vehicle.position
+            snapshot.positions[trip_id] = VehiclePosition(
+                vehicle.vehicle.id or None,
+                vehicle.vehicle.label or None,
+                position.latitude,
+                position.longitude,
+                position.bearing if position.HasField('bearing') else None,
+                position.speed if position.HasField('speed') else None,
+                vehicle.stop_id or None,
+                VEHICLE_STATUSES.get(vehicle.current_status, 'IN_TRANSIT_TO'),
+                vehicle.timestamp or None
+            )
+
+    return snapshot
+
+
+def parse_feed(data):
+    """Parse a feed body, JSON or protobuf"""
+    if data.lstrip()[:1] == b'{':
+        return parse_json_feed(json.loads(data))
+    return parse_protobuf_feed(data)
+
+
+class FeedSource:
+    """A feed location that only returns a body when it has changed"""
+
+    def __init__(self, location, timeout=10):
+        self.location = location
+        self.timeout = timeout
+        self.is_http = location.startswith(('http://', 'https://'))
+        self._validators = None  # (mtime, size) of the file, or (ETag, Last-Modified)
+        self._digest = None
+
+    def read(self):
+        """The feed body, or None if it hasn't changed since the last read"""
+        data = self._read_http() if self.is_http else self._read_file()
+        if data is None:
+            return None
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest == self._digest:
+            return None
+        self._digest = digest
+        return data
+
+    def _read_file(self):
+        stat = os.stat(self.location)
+        validators = (stat.st_mtime_ns, stat.st_size)
+        if validators == self._validators:
+            return None
+        with open(self.location, 'rb') as f:
+            data = f.read()
+        self._validators = validators
+        return data
+
+    def _read_http(self):
+        request = urllib.request.Request(self.location)
+        if self._validators:
+            etag, last_modified = self._validators
+            if etag:
+                request.add_header('If-None-Match', etag)
+            if last_modified:
+                request.add_header('If-Modified-Since', last_modified)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+                self._validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                return data
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+
+
+class RealtimeStore:
+    """trip_id -> latest TripUpdate / VehiclePosition, with change versions.
+
+    A single writer (the ingestion worker) applies snapshots; request threads
+    read. Lookups of one trip are plain dict reads; anything that iterates
+    takes the lock.
+
+    Versions count up from 0 in each process, so clients get them as tokens
+    ("<epoch>.<version>") naming the process and run they came from.
+    """
+
+    def __init__(self, history=100):
+        self.history = history
+        self.boot_id = secrets.token_hex(4)
+        self.version = 0
+        self.updated_at = None
+        self.updates = {}
+        self.positions = {}
+        self.changed_in = {}  # trip_id -> version of its last change
+        self.removed_in = {}  # trip_id -> version it was removed in, kept for `history` versions
+        self.by_stop = {}  # stop_id -> trip ids with a prediction there
+        self.stats = {'refreshes': 0, 'changed': 0, 'removed': 0, 'unmatched': 0}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call callback(version, {trip_id: state or None}) with the trips each refresh changed"""
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    @property
+    def epoch(self):
+        """Names this store's version sequence; differs between worker processes and across restarts"""
+        return f"{self.boot_id}-{os.getpid()}"
+
+    def version_token(self, version=None):
+        return f"{self.epoch}.{self.version if version is None else version}"
+
+    def count(self, **increments):
+        """Add to stats counters"""
+        with self._lock:
+            for name, n in increments.items():
+                self.stats[name] += n
+
+    def _index_stops(self, trip_id, old, new):
+        old_stops = {stu.stop_id for stu in old.stop_time_updates} if old else set()
+        new_stops = {stu.stop_id for stu in new.stop_time_updates} if new else set()
+        for stop_id in old_stops - new_stops:
+            trips = self.by_stop.get(stop_id)
+            if trips is not None:
+                trips.discard(trip_id)
+                if not trips:
+                    del self.by_stop[stop_id]
+        for stop_id in new_stops - old_stops:
+            self.by_stop.setdefault(stop_id, set()).add(trip_id)
+
+    def apply(self, snapshot):
+        """Apply a parsed feed, returning the changed trips ({trip_id: state or None})"""
+        changed = set()
+        with self._lock:
+            for current, incoming in ((self.updates, snapshot.updates), (self.positions, snapshot.positions)):
+                for trip_id, entry in incoming.items():
+                    old = current.get(trip_id)
+                    if old is None or old[:-1] != entry[:-1]:
+                        if current is self.updates:
+                            self._index_stops(trip_id, old, entry)
+                        current[trip_id] = entry
+                        changed.add(trip_id)
+
+                if snapshot.full:
+                    gone = current.keys() - incoming.keys()
+                else:
+                    gone = snapshot.deleted & current.keys()
+                for trip_id in gone:
+                    if current is self.updates:
+                        self._index_stops(trip_id, current[trip_id], None)
+                    del current[trip_id]
+                    changed.add(trip_id)
+
+            self.stats['refreshes'] += 1
+            self.updated_at = time.time()
+            if not changed:
+                return {}
+
+            self.version += 1
+            removed = 0
+            for trip_id in changed:
+                if trip_id in self.updates or trip_id in self.positions:
+                    self.changed_in[trip_id] = self.version
+                    self.removed_in.pop(trip_id, None)
+                else:
+                    self.changed_in.pop(trip_id, None)
+                    self.removed_in[trip_id] = self.version
+                    removed += 1
+            self.stats['changed'] += len(changed) - removed
+            self.stats['removed'] += removed
+
+            oldest = self.version - self.history
+            if self.removed_in and len(self.removed_in) > removed:
+                self.removed_in = {trip_id: v for trip_id, v in self.removed_in.items() if v > oldest}
+
+            delta = {trip_id: self.trip_state(trip_id) for trip_id in changed}
+            version = self.version
+
+        for callback in list(self._subscribers):
+            try:
+                callback(version, delta)
+            except Exception as e:
+                print(f"[realtime] subscriber failed: {e}")
+        return delta
+
+    def trip_state(self, trip_id):
+        """Serialized realtime state of a trip, or None if the feed doesn't report it"""
+        update = self.updates.get(trip_id)
+        position = self.positions.get(trip_id)
+        if update is None and position is None:
+            return None
+        return {
+            'trip_id': trip_id,
+            'route_id': update.route_id if update else None,
+            'schedule_relationship': update.schedule_relationship if update else 'SCHEDULED',
+            'delay': update.delay if update else None,
+            'stop_time_updates': [stu._asdict() for stu in update.stop_time_updates] if update else [],
+            'vehicle': {
+                'id': position.vehicle_id,
+                'label': position.label,
+                'latitude': position.latitude,
+                'longitude': position.longitude,
+                'bearing': position.bearing,
+                'speed': position.speed,
+                'stop_id': position.stop_id,
+                'current_status': position.current_status,
+                'timestamp': position.timestamp
+            } if position else None,
+            'version': self.changed_in.get(trip_id)
+        }
+
+    def changes_since(self, token):
+        """(version token, {trip_id: state or None} changed after `token`, full).
+
+        full is True when the caller should replace its state rather than
+        merge, and then every reported trip is returned: no token, one from
+        another process or an earlier run (a restart, or a load balancer
+        switching workers), one ahead of this store, or one older than the
+        removal history.
+        """
+        epoch, _, version = (token or '').rpartition('.')
+        with self._lock:
+            if epoch != self.epoch or not version.isdigit() \
+                    or not self.version - self.history <= int(version) <= self.version:
+                return self.version_token(), {trip_id: self.trip_state(trip_id) for trip_id in self.changed_in}, True
+            version = int(version)
+            changes = {trip_id: self.trip_state(trip_id)
+                       for trip_id, v in self.changed_in.items() if v > version}
+            changes.update((trip_id, None) for trip_id, v in self.removed_in.items() if v > version)
+            return self.version_token(), changes, False
+
+    def departures(self, stop_id, after):
+        """(epoch time, trip_id, StopTimeUpdate) of predicted departures from a stop after a time"""
+        with self._lock:
+            trip_ids = list(self.by_stop.get(stop_id, ()))
+        departures = []
+        for trip_id in trip_ids:
+            update = self.updates.get(trip_id)
+            if update is None:
+                continue
+            for stu in update.stop_time_updates:
+                if stu.stop_id == stop_id:
+                    when = stu.departure_time or stu.arrival_time
+                    if when is not None and when >= after:
+                        departures.append((when, trip_id, stu))
+                    break
+        departures.sort()
+        return departures
+
+
+store = RealtimeStore()
+
+_static_trips = None
+
+
+def get_static_trips():
+    """trip_id -> (route_id, trip_headsign) for the current feed, loaded once per feed"""
+    global _static_trips
+    if _static_trips is None:
+        _static_trips = {
+            trip_id: (route_id, headsign)
+            for trip_id, route_id, headsign in db.session.query(Trip.trip_id, Trip.route_id, Trip.trip_headsign)
+        }
+    return _static_trips
+
+
+@on_feed_change
+def release_static_trips():
+    """Forget the static trip ids so the new feed's are matched against"""
+    global _static_trips
+    _static_trips = None
+
+
+def match_static_trips(snapshot, static_trips):
+    """Drop entities for trips the static feed doesn't know, unless the feed added them,
+    and fill in route ids the feed left out"""
+    unmatched = 0
+    for trip_id, update in list(snapshot.updates.items()):
+        static_trip = static_trips.get(trip_id)
+        if static_trip is None:
+            if update.schedule_relationship != 'ADDED':
+                del snapshot.updates[trip_id]
+                unmatched += 1
+        elif update.route_id is None:
+            snapshot.updates[trip_id] = update._replace(route_id=static_trip[0])
+    for trip_id in list(snapshot.positions):
+        if trip_id not in static_trips and trip_id not in snapshot.updates:
+            del snapshot.positions[trip_id]
+            unmatched += 1
+    return unmatched
+
+
+class RealtimeWorker:
+    """Background thread polling the feed source into the store"""
+
+    def __init__(self, app, source, interval):
+        self.app = app
+        self.source = source
+        self.interval = interval
+        self.threads = ProcessThreads([('realtime-feed', self._run)])
+
+    def poll(self):
+        """Read the source once and apply it if it changed"""
+        data = self.source.read()
+        if data is None:
+            store.count(refreshes=1)
+            return {}
+        snapshot = parse_feed(data)
+        with self.app.app_context():
+            store.count(unmatched=match_static_trips(snapshot, get_static_trips()))
+        return store.apply(snapshot)
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[realtime] refresh from {self.source.location} failed: {e}")
+            time.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+
+def init_realtime(app):
+    """Start polling REALTIME_FEED_URL in each worker process, if configured"""
+    if not app.config['REALTIME_FEED_URL']:
+        return None
+
+    store.history = app.config['REALTIME_CHANGE_HISTORY']
+    worker = RealtimeWorker(app, FeedSource(app.config['REALTIME_FEED_URL']),
+                            app.config['REALTIME_POLL_SECONDS'])
+
+    @app.before_request
+    def start_realtime_worker():
+        worker.threads.ensure_started()
+
+    return worker
@@ -0,0 +1,137 @@
+"""Response helpers for large list endpoints.
+
+- stream_json() streams a {"key": [...]} document from an iterator (e.g. a
+  yield_per query) instead of materializing every row first.
+- Responses are compressed with brotli (if the brotli package is installed)
+  or gzip when the client accepts it: streamed responses always, buffered
+  ones above COMPRESS_MIN_SIZE bytes.
+- cached_json() serves payloads that only change with the transit feed from
+  a per-process cache, with each compressed variant built once.
+"""
+
+import gzip
+import zlib
+from flask import Response, current_app, request, stream_with_context
+from utils.feed import on_feed_change
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+_static_cache = {}
+
+
+def negotiate_encoding():
+    """Pick the best content encoding the client accepts, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterator of byte chunks incrementally"""
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def stream_json(key, items, serialize, **extra):
+    """Stream {"key": [serialize(item), ...], **extra} as a JSON response.
+
+    Items are serialized one at a time and sent in ~16KB chunks, so memory
+    stays bounded however many rows the iterator yields.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        buffer = [f'{{{dumps(key)}:['.encode()]
+        size = 0
+        first = True
+        for item in items:
+            data = dumps(serialize(item)).encode()
+            buffer.append(data if first else b',' + data)
+            first = False
+            size += len(data) + 1
+            if size >= STREAM_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        buffer.append(b']')
+        for name, value in extra.items():
+            buffer.append(f',{dumps(name)}:{dumps(value)}'.encode())
+        buffer.append(b'}')
+        yield b''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def cached_json(key, build):
+    """Serve a payload that only changes with the transit feed, pre-compressed per encoding"""
+    variants = _static_cache.get(key)
+    if variants is None:
+        variants = _static_cache[key] = {None: current_app.json.dumps(build()).encode()}
+
+    encoding = negotiate_encoding()
+    if encoding not in variants:
+        variants[encoding] = compress(variants[None], encoding)
+
+    response = Response(variants[encoding], mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@on_feed_change
+def clear_cached_json():
+    """Drop cached payloads when a new transit feed is published"""
+    _static_cache.clear()
+
+
+def init_app(app):
+    """Compress JSON responses for clients that accept it"""
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype != 'application/json' or 'Content-Encoding' in response.headers \
+                or response.direct_passthrough or not 200 <= response.status_code < 300:
+            return response
+
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compress(data, encoding))
+
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,94 @@
+"""Route-level user matching.
+
+RouteMatchIndex keeps every user's selected routes in memory, indexed by
+route, so finding users who share routes with someone is a few set
+lookups instead of a GROUP BY over user_routes. Writes bump the
+user_routes data version (utils/data_version.py) and report their net
+effect through user_routes_changed(), once per request however many rows
+they touched.
+"""
+
+import threading
+from collections import defaultdict
+from models import db
+from models.user_route import UserRoute
+from utils.data_version import data_version, bump_data_version
+
+
+class RouteMatchIndex:
+    """Riders per route, and each user's routes.
+
+    Request threads read and update the same sets (the ASGI mode runs Flask
+    on a thread pool), so every access takes the lock.
+    """
+
+    def __init__(self):
+        self.riders = defaultdict(set)
+        self.user_routes = defaultdict(set)
+        self.version = None  # user_routes data version the index reflects
+        self._lock = threading.Lock()
+
+    def _add(self, user_id, route_id):
+        self.riders[route_id].add(user_id)
+        self.user_routes[user_id].add(route_id)
+
+    def add(self, user_id, route_id):
+        with self._lock:
+            self._add(user_id, route_id)
+
+    def update(self, user_id, added=(), removed=()):
+        with self._lock:
+            for route_id in removed:
+                self.riders[route_id].discard(user_id)
+                self.user_routes[user_id].discard(route_id)
+            for route_id in added:
+                self._add(user_id, route_id)
+
+    def match(self, user_id):
+        """Map of other user id -> sorted route ids they share with the user"""
+        shared = defaultdict(list)
+        with self._lock:
+            for route_id in sorted(self.user_routes.get(user_id, ())):
+                for rider in self.riders.get(route_id, ()):
+                    if rider != user_id:
+                        shared[rider].append(route_id)
+        return shared
+
+
+def bump_user_routes_version():
+    """Record a write to user_routes; call before committing it"""
+    return bump_data_version(UserRoute.__tablename__)
+
+
+_index = None
+
+
+def get_route_match_index():
+    """Get the process-wide route match index, rebuilding it if user routes changed elsewhere"""
+    global _index
+    version = data_version(UserRoute.__tablename__)
+    if _index is None or _index.version != version:
+        index = RouteMatchIndex()
+        for user_id, route_id in db.session.query(UserRoute.user_id, UserRoute.route_id).yield_per(10000):
+            index.add(user_id, route_id)
+        index.version = version
+        _index = index
+    return _index
+
+
+def user_routes_changed(user_id, version, added=(), removed=()):
+    """Apply a committed change to a user's routes (bumped to `version`) to the index in place"""
+    global _index
+    if _index is None:
+        return
+    if _index.version != version - 1:
+        _index = None  # another worker changed user routes too; rebuild on next use
+        return
+    _index.update(user_id, added, removed)
+    _index.version = version
+
+
+def invalidate_route_match_index():
+    """Drop the index so it is rebuilt on next use"""
+    global _index
+    _index = None
@@ -0,0 +1,84 @@
+"""Process-wide, read-only store of the current feed's routes and stops.
+
+Routes and stops only change when a new feed is published, so instead of
+building ORM objects per request they are loaded once per feed version
+into immutable namedtuple records (no per-instance __dict__, no session
+state) with dict indexes by id and by short name / stop code. Records are
+read from the memory-mapped binary snapshot when there is one, otherwise
+from the transit database.
+"""
+
+from collections import namedtuple
+from models import db
+from models.transit import Route, Stop, get_snapshot
+from utils.feed import on_feed_change
+
+ROUTE_FIELDS = tuple(column.name for column in Route.__table__.columns)
+STOP_FIELDS = tuple(column.name for column in Stop.__table__.columns)
+
+
+class RouteRecord(namedtuple('RouteRecord', ROUTE_FIELDS)):
+    """Immutable route record"""
+
+    __slots__ = ()
+
+    # Same attributes as the ORM model, so its serializer works unchanged
+    to_dict = Route.to_dict
+
+
+class StopRecord(namedtuple('StopRecord', STOP_FIELDS)):
+    """Immutable stop record"""
+
+    __slots__ = ()
+
+    to_dict = Stop.to_dict
+
+
+class TransitStore:
+    """Routes and stops of one feed version, with lookup indexes"""
+
+    def __init__(self, routes, stops):
+        self.routes = tuple(sorted(routes, key=lambda route: route.route_short_name))
+        self.routes_by_id = {route.route_id: route for route in self.routes}
+        self.routes_by_short_name = {route.route_short_name: route for route in self.routes}
+
+        self.stops = tuple(sorted(stops, key=lambda stop: stop.stop_name))
+        self.stops_by_id = {stop.stop_id: stop for stop in self.stops}
+        self.stops_by_code = {stop.stop_code: stop for stop in self.stops if stop.stop_code}
+
+    @classmethod
+    def load(cls):
+        snapshot = get_snapshot()
+        if snapshot is not None and cls.snapshot_has_fields(snapshot):
+            return cls(
+                (RouteRecord(**row) for row in snapshot['routes']),
+                (StopRecord(**row) for row in snapshot['stops'])
+            )
+        return cls(
+            (RouteRecord(*row) for row in db.session.execute(db.select(*Route.__table__.columns))),
+            (StopRecord(*row) for row in db.session.execute(db.select(*Stop.__table__.columns)))
+        )
+
+    @staticmethod
+    def snapshot_has_fields(snapshot):
+        """Snapshots written before a column was added can't be used"""
+        return ('routes' in snapshot and set(snapshot['routes'].columns) == set(ROUTE_FIELDS)
+                and 'stops' in snapshot and set(snapshot['stops'].columns) == set(STOP_FIELDS))
+
+
+_store = None
+
+
+def get_transit_store():
+    """Get the reference store for the current feed, loading it on first use"""
+    global _store
+    if _store is None:
+        _store = TransitStore.load()
+    return _store
+
+
+@on_feed_change
+def release_transit_store():
+    """Drop the store so the new feed's routes and stops are loaded on next use"""
+    global _store
+    _store = None
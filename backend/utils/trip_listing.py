@@ -0,0 +1,88 @@
+"""Trips per route, service day and direction, cached per feed version.
+
+A listing is resolved once (calendar_dates -> service ids -> trips, read
+from the covering index idx_trip_route_service alone) and kept in a
+bounded LRU cache that is cleared when a new feed is published. Pages are
+cut from the cached listing with a trip_id keyset, so paging never
+re-queries.
+"""
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from models import db
+from models.transit import CalendarDate, Trip
+from utils.feed import on_feed_change
+
+CACHE_SIZE = 2048
+
+# Everything Trip.to_dict() needs, all held in idx_trip_route_service
+LISTING_COLUMNS = (
+    Trip.trip_id, Trip.route_id, Trip.service_id, Trip.trip_headsign, Trip.direction_id,
+    Trip.wheelchair_accessible, Trip.bikes_allowed
+)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class TripListing:
+    """Trips of one route on one day, sorted by trip_id"""
+
+    __slots__ = ('trip_ids', 'trips')
+
+    def __init__(self, rows):
+        self.trips = tuple(Trip(**row._asdict()).to_dict() for row in rows)
+        self.trip_ids = tuple(trip['trip_id'] for trip in self.trips)
+
+    def page(self, after=None, limit=50):
+        """Up to `limit` trips after the given trip_id, and the cursor for the next page"""
+        start = bisect_right(self.trip_ids, after) if after else 0
+        end = start + limit
+        next_after = self.trip_ids[end - 1] if end < len(self.trip_ids) else None
+        return list(self.trips[start:end]), next_after
+
+
+def service_ids_on(day):
+    """Service ids running on a date.
+
+    The GO feed has no calendar.txt, so services are the calendar_dates
+    entries that add service on that day.
+    """
+    return [row[0] for row in db.session.query(CalendarDate.service_id).filter(
+        CalendarDate.date == day, CalendarDate.exception_type == 1
+    )]
+
+
+def get_route_trips(route_id, day, direction=None):
+    """Get the (cached) listing of a route's trips on a day, optionally in one direction"""
+    key = (route_id, day, direction)
+    with _cache_lock:
+        listing = _cache.get(key)
+        if listing is not None:
+            _cache.move_to_end(key)
+            return listing
+
+    service_ids = service_ids_on(day)
+    rows = []
+    if service_ids:
+        query = db.session.query(*LISTING_COLUMNS).filter(
+            Trip.route_id == route_id, Trip.service_id.in_(service_ids)
+        )
+        if direction is not None:
+            query = query.filter(Trip.direction_id == direction)
+        rows = query.order_by(Trip.trip_id).all()
+    listing = TripListing(rows)
+
+    with _cache_lock:
+        _cache[key] = listing
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return listing
+
+
+@on_feed_change
+def clear_trip_listings():
+    """Drop cached listings when a new transit feed is published"""
+    with _cache_lock:
+        _cache.clear()